@@ -263,26 +263,19 @@ class AbstractCTCDecoding(ABC):
 
             if fold_consecutive:
                 if type(prediction) != list:
-                    prediction = prediction.numpy().tolist()
+                    prediction = prediction.numpy()
+                else:
+                    prediction = np.asarray(prediction, dtype=np.int64)
 
                 if predictions_len is not None:
                     prediction = prediction[:predictions_len]
 
-                # CTC decoding procedure
-                decoded_prediction = []
-                token_repetitions = []  # preserve number of repetitions per token
-
-                previous = self.blank_id
-                last_repetition = 0
-
-                for pidx, p in enumerate(prediction):
-                    if (p != previous or previous == self.blank_id) and p != self.blank_id:
-                        decoded_prediction.append(p)
-
-                        token_repetitions.append(pidx - last_repetition)
-                        last_repetition = pidx
-
-                    previous = p
+                # CTC decoding procedure: a token is emitted if it is not blank and differs from the previous token
+                previous = np.concatenate([[self.blank_id], prediction[:-1]]).astype(prediction.dtype)
+                emitted = np.flatnonzero((prediction != self.blank_id) & (prediction != previous))
+                decoded_prediction = prediction[emitted].tolist()
+                # preserve number of repetitions per token
+                token_repetitions = np.diff(emitted, prepend=0).tolist()
 
             else:
                 if predictions_len is not None:
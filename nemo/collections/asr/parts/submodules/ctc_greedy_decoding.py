@@ -31,7 +31,7 @@ def pack_hypotheses(hypotheses: List[rnnt_utils.Hypothesis], logitlen: torch.Ten
             logitlen_cpu = logitlen
 
     for idx, hyp in enumerate(hypotheses):  # type: rnnt_utils.Hypothesis
-        hyp.y_sequence = torch.tensor(hyp.y_sequence, dtype=torch.long)
+        hyp.y_sequence = torch.as_tensor(hyp.y_sequence, dtype=torch.long)
 
         if logitlen is not None:
             hyp.length = logitlen_cpu[idx]
@@ -114,6 +114,9 @@ class GreedyCTCInfer(Typing):
             hypotheses = []
             # Process each sequence independently
             prediction_cpu_tensor = decoder_output.cpu()
+            # Lengths are moved to CPU once instead of synchronizing with the device for every sample
+            if torch.is_tensor(decoder_lengths):
+                decoder_lengths = decoder_lengths.cpu()
 
             if prediction_cpu_tensor.ndim < 2 or prediction_cpu_tensor.ndim > 3:
                 raise ValueError(
@@ -152,7 +155,7 @@ class GreedyCTCInfer(Typing):
         prediction_logprobs, prediction_labels = prediction.max(dim=-1)
 
         non_blank_ids = prediction_labels != self.blank_id
-        hypothesis.y_sequence = prediction_labels.numpy().tolist()
+        hypothesis.y_sequence = prediction_labels
         hypothesis.score = (prediction_logprobs[non_blank_ids]).sum()
 
         if self.preserve_alignments:
@@ -177,7 +180,8 @@ class GreedyCTCInfer(Typing):
             prediction_labels = prediction_labels[:out_len]
 
         non_blank_ids = prediction_labels != self.blank_id
-        hypothesis.y_sequence = prediction_labels.numpy().tolist()
+        # Labels are a view of the caller's tensor if it is already on CPU, so they are copied
+        hypothesis.y_sequence = prediction_labels.clone()
         hypothesis.score = -1.0
 
         if self.preserve_alignments:
@@ -153,7 +153,7 @@ class ConcatDataset(IterableDataset):
         p = p / np.sum(p)
 
         while True:
-            ind = np.random.choice(np.arange(num), p=p)
+            ind = np.random.choice(num, p=p)
             yield ind
 
     @staticmethod
@@ -174,7 +174,7 @@ class ConcatDataset(IterableDataset):
             raise ValueError("Length of probabilities list must be equal to the number of datasets.")
 
         while True:
-            ind = np.random.choice(np.arange(num), p=p)
+            ind = np.random.choice(num, p=p)
             yield ind
 
 
@@ -249,7 +249,7 @@ class ConcatMapDataset(Dataset):
 
     def _get_dataset_index(self, idx):
         if self.sampling_technique == 'temperature' or self.sampling_technique == 'random':
-            return self.np_rng.choice(np.arange(len(self.datasets)), p=self.p)
+            return self.np_rng.choice(len(self.datasets), p=self.p)
         elif self.sampling_technique == 'round-robin':
             return idx % len(self.datasets)
 
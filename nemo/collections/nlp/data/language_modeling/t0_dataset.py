@@ -46,6 +46,10 @@ class T0JSONLMemMapDataset(TextMemMapDataset):
         if tokenizer is None:
             raise ValueError("Tokenizer must be provided to use T0JSONLMemMapDataset, got None")
         self.tokenizer = tokenizer
+        # tokenizer special ids are properties, resolve them once instead of per sample/batch
+        self._bos_id = int(tokenizer.bos_id)
+        self._eos_id = int(tokenizer.eos_id)
+        self._pad_id = int(tokenizer.pad_id)
         self.max_src_seq_length = max_src_seq_length
         self.max_tgt_seq_length = max_tgt_seq_length
 
@@ -58,18 +62,9 @@ class T0JSONLMemMapDataset(TextMemMapDataset):
             tokenized_input = tokenized_input[: self.max_src_seq_length - 2]
         if len(tokenized_output) > self.max_tgt_seq_length - 2:
             tokenized_output = tokenized_output[: self.max_tgt_seq_length - 2]
-        text_enc = [self.tokenizer.bos_id] + tokenized_input + [self.tokenizer.eos_id]
-        target = [self.tokenizer.bos_id] + tokenized_output + [self.tokenizer.eos_id]
-        original = ""
-        template = ""
-        for item in example['chunked_idx'].split(', '):
-            item = item.split('-')
-            if item[0] == "original_text":
-                original += example['input'][int(item[1]) : int(item[2])]
-            elif item[0] == "template":
-                template += example['input'][int(item[1]) : int(item[2])]
-            else:
-                raise ValueError(f"Unknown chunk type: {item[0]}")
+        text_enc = [self._bos_id] + tokenized_input + [self._eos_id]
+        target = [self._bos_id] + tokenized_output + [self._eos_id]
+        original, template = self._split_chunks(example['input'], example['chunked_idx'])
 
         return {
             'text_enc': text_enc,
@@ -80,11 +75,38 @@ class T0JSONLMemMapDataset(TextMemMapDataset):
             'prompt': self.tokenizer.text_to_ids(example['prompt']),
         }
 
+    def _split_chunks(self, text, chunked_idx):
+        """
+        Split text into its original text and template parts given spans like
+        'template-0-12, original_text-12-40'
+        """
+        chunks = {"original_text": [], "template": []}
+        for item in chunked_idx.split(', '):
+            chunk_type, start, end = item.split('-')[:3]
+            if chunk_type not in chunks:
+                raise ValueError(f"Unknown chunk type: {chunk_type}")
+            chunks[chunk_type].append(text[int(start) : int(end)])
+        return ''.join(chunks["original_text"]), ''.join(chunks["template"])
+
     def _maybe_cast_to_list(self, x):
         if isinstance(x, np.ndarray):
             return [item.tolist() for item in x]
         return x
 
+    def _pad_to_tensor(self, items, pad_id):
+        """Right-pad a list of token id lists into a single [batch, max_len] LongTensor."""
+        max_length = max([len(item) for item in items]) if items else 0
+        padded = np.full((len(items), max_length), pad_id, dtype=np.int64)
+        for i, item in enumerate(items):
+            padded[i, : len(item)] = item
+        return torch.from_numpy(padded)
+
+    def _length_mask(self, items):
+        """Return a [batch, max_len] bool mask that is True on the positions covered by each item."""
+        lengths = np.array([len(item) for item in items], dtype=np.int64)
+        max_length = lengths.max() if items else 0
+        return torch.from_numpy(np.arange(max_length)[None, :] < lengths[:, None])
+
     def collate_fn(self, batch):
         enc_query = [item['text_enc'] for item in batch]
         dec_input = [item['text_dec'] for item in batch]
@@ -100,31 +122,16 @@ class T0JSONLMemMapDataset(TextMemMapDataset):
         template = self._maybe_cast_to_list(template)
         prompt = self._maybe_cast_to_list(prompt)
 
-        max_dec_input_length = max([len(item) for item in dec_input]) if dec_input else 0
-        max_enc_query_length = max([len(item) for item in enc_query]) if enc_query else 0
-        max_label_length = max([len(item) for item in labels]) if labels else 0
-        max_original_length = max([len(item) for item in original]) if original else 0
-        max_template_length = max([len(item) for item in template]) if template else 0
-        max_prompt_length = max([len(item) for item in prompt]) if prompt else 0
-
-        loss_mask = [([1] * (len(item))) + ([0] * (max_label_length - len(item))) for item in labels]
-        enc_query = [item + [self.tokenizer.pad_id] * (max_enc_query_length - len(item)) for item in enc_query]
-        dec_input = [item + [self.tokenizer.pad_id] * (max_dec_input_length - len(item)) for item in dec_input]
-        labels = [item + [self.tokenizer.pad_id] * (max_label_length - len(item)) for item in labels]
-        original = [item + [self.tokenizer.pad_id] * (max_original_length - len(item)) for item in original]
-        template = [item + [self.tokenizer.pad_id] * (max_template_length - len(item)) for item in template]
-        prompt = [item + [self.tokenizer.pad_id] * (max_prompt_length - len(item)) for item in prompt]
-
-        enc_query = torch.LongTensor(enc_query)
-        dec_input = torch.LongTensor(dec_input)
-        labels = torch.LongTensor(labels)
-        loss_mask = torch.LongTensor(loss_mask)
-        original = torch.LongTensor(original)
-        template = torch.LongTensor(template)
-        prompt = torch.LongTensor(prompt)
-
-        enc_mask = (enc_query != self.tokenizer.pad_id).long()
-        dec_mask = (dec_input != self.tokenizer.pad_id).long()
+        loss_mask = self._length_mask(labels).to(torch.uint8)
+        enc_mask = self._length_mask(enc_query)
+        dec_mask = self._length_mask(dec_input)
+
+        enc_query = self._pad_to_tensor(enc_query, self._pad_id)
+        dec_input = self._pad_to_tensor(dec_input, self._pad_id)
+        labels = self._pad_to_tensor(labels, self._pad_id)
+        original = self._pad_to_tensor(original, self._pad_id)
+        template = self._pad_to_tensor(template, self._pad_id)
+        prompt = self._pad_to_tensor(prompt, self._pad_id)
 
         return {
             'text_enc': enc_query,
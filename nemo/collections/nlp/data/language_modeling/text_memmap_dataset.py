@@ -25,7 +25,7 @@ import torch
 from nemo.core import Dataset
 from nemo.utils import logging
 
-__all__ = ['TextMemMapDataset', 'CSVMemMapDataset', 'build_index_files']
+__all__ = ['TextMemMapDataset', 'CSVMemMapDataset', 'build_index_files', 'build_index_files_on_rank_zero']
 __idx_version__ = '0.1'  # index file version
 __idx_suffix__ = 'idx'  # index file suffix
 
@@ -62,13 +62,7 @@ class TextMemMapDataset(Dataset):
 
         logging.info(f"Building data files")
         # load all files into memmap
-        is_ditributed = torch.distributed.is_available() and torch.distributed.is_initialized()
-
-        if not is_ditributed or (is_ditributed and torch.distributed.get_rank() == 0):
-            build_index_files(dataset_paths, newline_int, workers=self._worker)
-
-        if is_ditributed:
-            torch.distributed.barrier()
+        build_index_files_on_rank_zero(dataset_paths, newline_int, workers=self._worker)
 
         logging.info(f"Loading data files")
         start_time = time.time()
@@ -215,17 +209,16 @@ def _build_memmap_index_files(newline_int, fn):
         return False
     else:
         logging.info(f"Building idx file = {idx_fn}")
-        midx = np.where(mdata == newline_int)[0]
+        midx = np.flatnonzero(mdata == newline_int)
         midx_dtype = midx.dtype
         # add last item in case there is no new-line
         if (len(midx) == 0) or (midx[-1] + 1 != len(mdata)):
-            midx = np.asarray(midx.tolist() + [len(midx) + 1], dtype=midx_dtype)
+            midx = np.append(midx, len(midx) + 1).astype(midx_dtype)
 
-        # remove empty lines from end of file
-        midx = midx.tolist()
-        while len(midx) > 1 and (midx[-1] - midx[-2]) < 2:
-            midx.pop(-1)
-        midx = np.asarray(midx, dtype=midx_dtype)
+        # remove empty lines from end of file (keep up to the last line that is at least one byte long)
+        if len(midx) > 1:
+            non_empty = np.flatnonzero(np.diff(midx) >= 2)
+            midx = midx[: non_empty[-1] + 2] if len(non_empty) else midx[:1]
 
         data = dict(midx=midx, newline_int=newline_int, version=__idx_version__)
         pickle.dump(data, open(idx_fn, "wb"))
@@ -240,15 +233,33 @@ def build_index_files(dataset_paths, newline_int, workers=None):
     if len(dataset_paths) < 1:
         raise ValueError("files_list must contain at leat one file name")
 
+    # skip files that are already indexed so that no worker pool is spawned when there is nothing to build
+    missing_paths = [fn for fn in dataset_paths if not os.path.exists(f"{fn}.{__idx_suffix__}")]
+    if len(missing_paths) == 0:
+        logging.info(f"Found index files for all {len(dataset_paths)} data files")
+        return
+
     if workers is None:
         workers = max(1, os.cpu_count() // 2)
+    workers = min(workers, len(missing_paths))
 
-    logging.info(f"Processing {len(dataset_paths)} data files using {workers} workers")
+    logging.info(f"Processing {len(missing_paths)} data files using {workers} workers")
     # load all files into memmap
     start_time = time.time()
     with mp.Pool(workers) as p:
-        build_status = p.map(partial(_build_memmap_index_files, newline_int), dataset_paths)
+        build_status = p.map(partial(_build_memmap_index_files, newline_int), missing_paths)
 
     logging.info(
         f'Time building {sum(build_status)} / {len(build_status)} mem-mapped files: {datetime.timedelta(seconds=time.time() - start_time)}'
     )
+
+
+def build_index_files_on_rank_zero(dataset_paths, newline_int, workers=None):
+    """Builds index files on rank 0 only, other ranks wait until the index files are ready"""
+    is_distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+
+    if not is_distributed or torch.distributed.get_rank() == 0:
+        build_index_files(dataset_paths, newline_int, workers=workers)
+
+    if is_distributed:
+        torch.distributed.barrier()
@@ -31,6 +31,7 @@ import itertools
 import multiprocessing as mp
 import os
 import pickle
+import sys
 import tempfile
 from dataclasses import dataclass
 from math import ceil
@@ -168,7 +169,7 @@ class PunctuationCapitalizationDataConfigBase:
 
     n_jobs: Optional[int] = 0
     """Number of workers used for features creation (tokenization, label encoding, and clipping). If 0, then
-    multiprocessing is not used; if ``None``, then n_jobs is equal to the number of CPU cores.
+    multiprocessing is not used; if ``None``, then n_jobs is equal to the number of CPU cores available to the process.
     There can be weird deadlocking errors with some tokenizers (e.g. SentencePiece) if ``n_jobs`` is greater than zero.
     """
 
@@ -455,6 +456,25 @@ class Progress:
         self.progress_process.join()
 
 
+def _get_max_token_id(tokenizer: TokenizerSpec) -> int:
+    """
+    Returns an upper bound of token ids produced by ``tokenizer`` or ``-1`` if the bound is unknown. Added and special
+    tokens can have ids which are not less than ``tokenizer.vocab_size``, so they are taken into account.
+    """
+    vocab_size = getattr(tokenizer, 'vocab_size', 0)
+    if not vocab_size:
+        return -1
+    token_ids = [vocab_size - 1]
+    for name in ['cls_id', 'sep_id', 'pad_id', 'unk_id']:
+        token_id = getattr(tokenizer, name, None)
+        if isinstance(token_id, (int, np.integer)):
+            token_ids.append(token_id)
+    hf_tokenizer = getattr(tokenizer, 'tokenizer', None)
+    if hasattr(hf_tokenizer, '__len__'):
+        token_ids.append(len(hf_tokenizer) - 1)
+    return max(token_ids)
+
+
 class TokenizeCreateMasksClipWorker:
     """A worker for tokenization, encoding labels, creating masks for first token in a word, sequence clipping"""
 
@@ -488,11 +508,21 @@ class TokenizeCreateMasksClipWorker:
         self.pad_label = pad_label
         self.verbose = verbose
         self.progress_queue = progress_queue
+        # Label vocabularies are small, so encoded labels are stored in the narrowest integer type fitting all ids
+        label_ids = list((punct_label_ids or {}).values()) + list((capit_label_ids or {}).values())
+        self.label_dtype = np.int8 if max(label_ids, default=0) <= np.iinfo(np.int8).max else np.int32
+        # Token ids are stored as uint16 if all ids fit into it. Batches are cast back to int32
+        self.id_dtype = np.uint16 if 0 <= _get_max_token_id(tokenizer) <= np.iinfo(np.uint16).max else np.int32
 
-    def _maybe_clip(self, values: List[int], append_value: int) -> List[int]:
-        if len(values) > self.max_seq_length:
-            return values[: self.max_seq_length - 1] + [append_value]
-        return values
+    def _tokenize_words(self, words: List[str]) -> List[List[int]]:
+        """
+        Tokenizes every word in ``words`` separately. If ``self.tokenizer`` wraps a HuggingFace fast tokenizer, then
+        all words are encoded in one batched call instead of one ``text_to_ids`` call per word.
+        """
+        hf_tokenizer = getattr(self.tokenizer, 'tokenizer', None)
+        if words and getattr(hf_tokenizer, 'is_fast', False):
+            return hf_tokenizer(words, add_special_tokens=False)['input_ids']
+        return [self.tokenizer.text_to_ids(word) for word in words]
 
     def __call__(
         self,
@@ -525,13 +555,14 @@ class TokenizeCreateMasksClipWorker:
             preload_audios: whether to preload audios or not
 
         Returns:
-            input_ids: a list of 1D int32 arrays. Each array contains token ids of the corresponding query
+            input_ids: a list of 1D uint16 arrays (int32 if tokenizer vocabulary is too big for uint16). Each array
+                contains token ids of the corresponding query
             subtokens_mask: a list of 1D boolean arrays. An array element is ``True`` if corresponding token is the
                 first token in a word
-            punct_labels: a list of 1D int32 arrays. Encoded punctuation labels for every token in a query. Tokens in
-                one word have identical labels
-            capit_labels: a list of 1D int32 arrays. Encoded capitalization labels for every token in a query. Tokens
-                in one word have identical labels
+            punct_labels: a list of 1D int8 arrays (int32 if label ids do not fit into int8). Encoded punctuation
+                labels for every token in a query. Tokens in one word have identical labels
+            capit_labels: a list of 1D int8 arrays (int32 if label ids do not fit into int8). Encoded capitalization
+                labels for every token in a query. Tokens in one word have identical labels
         """
         all_input_ids, all_subtokens_mask, punct_all_labels, capit_all_labels = [], [], [], []
         dummy = [None] * len(queries)  # Needed to avoid code duplication with different values of `self.use_audio`
@@ -539,39 +570,55 @@ class TokenizeCreateMasksClipWorker:
         audio_lengths = [] if preload_audios else dummy
         audio_filepaths = [] if not preload_audios else dummy
         progress_made = 0
+        words_per_query = [query.split() for query in queries]
+        ids_per_word = self._tokenize_words(list(itertools.chain.from_iterable(words_per_query)))
+        # Labels of all queries are encoded at once. A query has as many labels as words, so labels of a query are
+        # found using the same offset as its words
+        encoded_punct_labels = np.fromiter(
+            map(self.punct_label_ids.__getitem__, itertools.chain.from_iterable(punct_label_lines)),
+            dtype=self.label_dtype,
+        )
+        encoded_capit_labels = np.fromiter(
+            map(self.capit_label_ids.__getitem__, itertools.chain.from_iterable(capit_label_lines)),
+            dtype=self.label_dtype,
+        )
+        pad_id = self.punct_label_ids[self.pad_label]
+        word_offset = 0
         queries = zip(queries, audio_queries) if audio_queries else zip(queries, dummy)
         for i, (query, audio_query) in enumerate(queries):
-            words = query.split()
-            input_ids, subtokens_mask = [self.tokenizer.cls_id], [0]
+            words = words_per_query[i]
             _check_number_of_labels(words, query, i, split_i, punct_label_lines[i], capit_label_lines[i])
-            pad_id = self.punct_label_ids[self.pad_label]
-            punct_labels = [pad_id]
-            punct_query_labels = [self.punct_label_ids[lab] for lab in punct_label_lines[i]]
-            capit_labels = [pad_id]
-            capit_query_labels = [self.capit_label_ids[lab] for lab in capit_label_lines[i]]
+            punct_query_labels = encoded_punct_labels[word_offset : word_offset + len(words)]
+            capit_query_labels = encoded_capit_labels[word_offset : word_offset + len(words)]
+            query_word_ids = []
             for j, word in enumerate(words):
-                word_ids = self.tokenizer.text_to_ids(word)
+                word_ids = ids_per_word[word_offset + j]
                 if not word_ids and len(word):
                     word_ids = [self.tokenizer.unk_id]
-                input_ids.extend(word_ids)
-
-                subtokens_mask.append(1)
-                subtokens_mask.extend([0] * (len(word_ids) - 1))
-
-                punct_labels.extend([punct_query_labels[j]] * len(word_ids))
-                capit_labels.extend([capit_query_labels[j]] * len(word_ids))
-
-            # add eos token
-            input_ids.append(self.tokenizer.sep_id)
-            subtokens_mask.append(0)
-
-            all_input_ids.append(np.array(self._maybe_clip(input_ids, self.tokenizer.sep_id), dtype=np.int32))
-            all_subtokens_mask.append(np.array(self._maybe_clip(subtokens_mask, 0), dtype=bool))
-
-            punct_labels.append(pad_id)
-            punct_all_labels.append(np.array(self._maybe_clip(punct_labels, pad_id), dtype=np.int32))
-            capit_labels.append(pad_id)
-            capit_all_labels.append(np.array(self._maybe_clip(capit_labels, pad_id), dtype=np.int32))
+                query_word_ids.append(word_ids)
+            word_offset += len(words)
+            word_lengths = np.array([len(word_ids) for word_ids in query_word_ids], dtype=np.int64)
+            # [CLS] and [SEP] tokens are added on both sides of the query. Tokens which do not fit into
+            # ``self.max_seq_length`` are dropped before arrays are created
+            num_tokens = min(int(word_lengths.sum()) + 2, self.max_seq_length)
+            word_starts = 1 + np.cumsum(word_lengths) - word_lengths
+            # Number of words which start before [SEP] token
+            num_words = np.searchsorted(word_starts, num_tokens - 1)
+
+            input_ids = np.empty(num_tokens, dtype=self.id_dtype)
+            input_ids[0], input_ids[-1] = self.tokenizer.cls_id, self.tokenizer.sep_id
+            input_ids[1:-1] = list(itertools.islice(itertools.chain.from_iterable(query_word_ids), num_tokens - 2))
+            subtokens_mask = np.zeros(num_tokens, dtype=bool)
+            subtokens_mask[word_starts[:num_words]] = True
+            punct_labels = np.full(num_tokens, pad_id, dtype=self.label_dtype)
+            punct_labels[1:-1] = np.repeat(punct_query_labels[:num_words], word_lengths[:num_words])[: num_tokens - 2]
+            capit_labels = np.full(num_tokens, pad_id, dtype=self.label_dtype)
+            capit_labels[1:-1] = np.repeat(capit_query_labels[:num_words], word_lengths[:num_words])[: num_tokens - 2]
+
+            all_input_ids.append(input_ids)
+            all_subtokens_mask.append(subtokens_mask)
+            punct_all_labels.append(punct_labels)
+            capit_all_labels.append(capit_labels)
             if preload_audios and audio_query:
                 if ASR_AVAILABLE:
                     segment = AudioSegment.from_file(audio_query.strip(), target_sr=sample_rate)
@@ -605,6 +652,21 @@ class TokenizeCreateMasksClipWorker:
         )
 
 
+# A worker instance created once per pool process by ``_init_tokenize_create_masks_clip_worker``
+_TOKENIZE_CREATE_MASKS_CLIP_WORKER: Optional[TokenizeCreateMasksClipWorker] = None
+
+
+def _init_tokenize_create_masks_clip_worker(*worker_args: Any) -> None:
+    """A ``multiprocessing.Pool`` initializer which creates worker once per process, so that the tokenizer is pickled
+    once per process instead of once per data split."""
+    global _TOKENIZE_CREATE_MASKS_CLIP_WORKER
+    _TOKENIZE_CREATE_MASKS_CLIP_WORKER = TokenizeCreateMasksClipWorker(*worker_args)
+
+
+def _tokenize_create_masks_clip(args: Tuple[Any, ...]) -> Tuple[List[Any], ...]:
+    return _TOKENIZE_CREATE_MASKS_CLIP_WORKER(*args)
+
+
 def _get_features(
     queries: Union[List[str], Tuple[str, ...]],
     punct_label_lines: Union[List[str], Tuple[str, ...]],
@@ -638,7 +700,7 @@ def _get_features(
         verbose: whether to show examples of tokenized data and various progress information
         n_jobs: a number of workers used for preparing features. If ``n_jobs <= 0``, then do not use multiprocessing
             and run features creation in this process. If not set, number of workers will be equal to the number of
-            CPUs.
+            CPUs available to the process.
 
             !!WARNING!!
             There can be deadlocking problems with some tokenizers (e.g. SentencePiece, HuggingFace AlBERT)
@@ -650,19 +712,21 @@ def _get_features(
         preload_audios: whether to preload audios or not
 
     Returns:
-        input_ids: a list of 1D int32 arrays. Each array contains token ids of corresponding query
+        input_ids: a list of 1D uint16 or int32 arrays. Each array contains token ids of corresponding query
         subtokens_mask: a list of 1D boolean arrays. An array element is ``True`` if corresponding token is the
             first token in a word
-        punct_labels: a list of 1D int32 arrays. Encoded punctuation labels for every token in a query. Tokens in one
-            word have identical labels.
-        capit_labels: a list of 1D int32 arrays. Encoded capitalization labels for every token in a query. Tokens in
-            one word have identical labels
+        punct_labels: a list of 1D int8 or int32 arrays. Encoded punctuation labels for every token in a query. Tokens
+            in one word have identical labels.
+        capit_labels: a list of 1D int8 or int32 arrays. Encoded capitalization labels for every token in a query.
+            Tokens in one word have identical labels
     """
     if verbose:
         logging.info("Start initial tokenization.")
     create_progress_process = progress_queue is None
     if n_jobs is None:
-        n_jobs = min(mp.cpu_count(), len(queries))
+        # CPUs available to this process can be fewer than CPUs of the machine, e.g. in Slurm or Kubernetes jobs
+        num_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else mp.cpu_count()
+        n_jobs = min(num_cpus, len(queries))
     if verbose:
         logging.info(f"Running tokenization with {n_jobs} jobs.")
 
@@ -699,28 +763,34 @@ def _get_features(
     if create_progress_process:
         progress = Progress(len(queries), "Tokenization", "query")
         progress_queue = progress.get_queues()[0]
+    worker_args = (max_seq_length, tokenizer, punct_label_ids, capit_label_ids, pad_label, verbose, progress_queue)
+    features = tuple([] for _ in range(7))
+
+    def collect(split_result: Tuple[List[Any], ...]) -> None:
+        # Results of a split are merged as soon as they are ready so that all splits are not held in memory twice
+        for feature, split_feature in zip(features, split_result):
+            feature.extend(split_feature)
+
     if n_jobs > 0:
-        with mp.Pool(n_jobs) as pool:
-            result = pool.starmap(
-                TokenizeCreateMasksClipWorker(
-                    max_seq_length, tokenizer, punct_label_ids, capit_label_ids, pad_label, verbose, progress_queue,
-                ),
-                args,
-            )
+        # Prevent tokenizer parallelism inside workers (unless user has explicitly set it)
+        if 'TOKENIZERS_PARALLELISM' not in os.environ:
+            os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+        # On Linux forked workers share the tokenizer with the master process copy-on-write instead of unpickling it.
+        # Other platforms keep their default start method because forking is unsafe e.g. on macOS
+        mp_context = mp.get_context('fork') if sys.platform.startswith('linux') else mp.get_context()
+        with mp_context.Pool(
+            n_jobs, initializer=_init_tokenize_create_masks_clip_worker, initargs=worker_args
+        ) as pool:
+            for split_result in pool.imap(_tokenize_create_masks_clip, args):
+                collect(split_result)
     else:
-        result = []
+        worker = TokenizeCreateMasksClipWorker(*worker_args)
         for x in args:
-            result.append(
-                TokenizeCreateMasksClipWorker(
-                    max_seq_length, tokenizer, punct_label_ids, capit_label_ids, pad_label, verbose, progress_queue,
-                )(*x)
-            )
+            collect(worker(*x))
     if create_progress_process:
         progress.finish()
 
-    input_ids, subtokens_mask, punct_labels, capit_labels, waveforms, audio_lengths, audio_filepaths = tuple(
-        list(itertools.chain(*e)) for e in zip(*result)
-    )
+    input_ids, subtokens_mask, punct_labels, capit_labels, waveforms, audio_lengths, audio_filepaths = features
     if verbose:
         logging.info("Finished initial tokenization.")
         get_stats([len(inp) for inp in input_ids])
@@ -744,6 +814,12 @@ def _get_features(
     )
 
 
+def _get_special_tokens_mask(input_ids: np.ndarray, cls_id: int, sep_id: int) -> np.ndarray:
+    special_mask = np.equal(input_ids, cls_id)
+    special_mask |= np.equal(input_ids, sep_id)
+    return special_mask
+
+
 def create_masks_and_segment_ids(
     input_ids: np.ndarray,
     subtokens_mask: np.ndarray,
@@ -782,15 +858,16 @@ def create_masks_and_segment_ids(
     """
     segment_ids = np.zeros_like(input_ids, dtype=np.int8)
     input_mask = np.not_equal(input_ids, pad_id)
-    special_mask = np.equal(input_ids, cls_id) & np.equal(input_ids, sep_id)
     if ignore_start_end:
         if ignore_extra_tokens:
             loss_mask = subtokens_mask
         else:
-            loss_mask = input_mask & ~special_mask
+            special_mask = _get_special_tokens_mask(input_ids, cls_id, sep_id)
+            loss_mask = np.logical_and(input_mask, np.logical_not(special_mask, out=special_mask), out=special_mask)
     else:
         if ignore_extra_tokens:
-            loss_mask = subtokens_mask | special_mask
+            special_mask = _get_special_tokens_mask(input_ids, cls_id, sep_id)
+            loss_mask = np.logical_or(subtokens_mask, special_mask, out=special_mask)
         else:
             loss_mask = input_mask
     return segment_ids, input_mask, loss_mask
@@ -887,6 +964,74 @@ def raise_not_equal_labels_error(
     raise ValueError(msg)
 
 
+def _flatten_features(features: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    """
+    Concatenates per query arrays of input ids, subtokens mask, punctuation and capitalization labels returned by
+    :func:`_get_features`, so that features are pickled as several big arrays instead of millions of small ones.
+    Subtokens mask is additionally packed into bits. Audio features are left as is.
+
+    Args:
+        features: a tuple returned by :func:`_get_features`
+
+    Returns:
+        a tuple which elements are the same as in ``features`` except for text features which are replaced by
+        concatenated arrays. The last element of the tuple is an array of offsets of queries in concatenated arrays.
+        If there are no queries, ``features`` are returned as is
+    """
+    input_ids, subtokens_mask, waveforms, waveforms_length, audio_filepaths, punct_labels, capit_labels = features
+    if len(input_ids) == 0:
+        # ``np.concatenate`` cannot concatenate an empty list. Empty lists are restored as is by
+        # :func:`_restore_cached_features`
+        return features
+    offsets = np.zeros([len(input_ids) + 1], dtype=np.int64)
+    np.cumsum([len(inp) for inp in input_ids], out=offsets[1:])
+    return (
+        np.concatenate(input_ids),
+        np.packbits(np.concatenate(subtokens_mask)),
+        waveforms,
+        waveforms_length,
+        audio_filepaths,
+        np.concatenate(punct_labels),
+        np.concatenate(capit_labels),
+        offsets,
+    )
+
+
+def _unflatten_features(features: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    """A reverse of :func:`_flatten_features`. Per query arrays are views of concatenated arrays."""
+    (
+        input_ids,
+        subtokens_mask,
+        waveforms,
+        waveforms_length,
+        audio_filepaths,
+        punct_labels,
+        capit_labels,
+        offsets,
+    ) = features
+    subtokens_mask = np.unpackbits(subtokens_mask, count=offsets[-1]).astype(bool)
+    return (
+        np.split(input_ids, offsets[1:-1]),
+        np.split(subtokens_mask, offsets[1:-1]),
+        waveforms,
+        waveforms_length,
+        audio_filepaths,
+        np.split(punct_labels, offsets[1:-1]),
+        np.split(capit_labels, offsets[1:-1]),
+    )
+
+
+def _restore_cached_features(features: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    """
+    Restores features loaded from a features pickle file (without label ids). Features cached by older versions
+    are pickled as lists of per query arrays and are returned as is. Features saved by :func:`_flatten_features`
+    are unflattened.
+    """
+    if isinstance(features[0], np.ndarray):
+        return _unflatten_features(features)
+    return features
+
+
 def pad(vectors: List[np.ndarray], length: int, value: Union[int, float, bool]) -> np.ndarray:
     """
     Pad vectors to length ``length`` and then stack.
@@ -899,10 +1044,50 @@ def pad(vectors: List[np.ndarray], length: int, value: Union[int, float, bool])
     Returns:
         an array of padded vectors
     """
-    result = []
-    for v in vectors:
-        result.append(np.concatenate([v, np.full([length - v.shape[0]], value, dtype=v.dtype)]))
-    return np.stack(result)
+    result = np.full([len(vectors), length], value, dtype=vectors[0].dtype)
+    for i, v in enumerate(vectors):
+        result[i, : v.shape[0]] = v
+    return result
+
+
+def _pad_text_features(
+    input_ids: List[np.ndarray],
+    subtokens_mask: List[np.ndarray],
+    punct_labels: List[np.ndarray],
+    capit_labels: List[np.ndarray],
+    length: int,
+    pad_id: int,
+    punct_pad_id: int,
+    capit_pad_id: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pads and stacks text features of a batch in one pass. Works as 4 calls of :func:`pad` but every vector of a query
+    is copied in the same loop iteration and arrays are created with batch dtypes: ``np.int32`` for input ids,
+    ``bool`` for subtokens mask, ``np.int64`` for labels.
+
+    Args:
+        input_ids: a list of 1D arrays with token ids of queries
+        subtokens_mask: a list of 1D boolean arrays with masks of first tokens in words
+        punct_labels: a list of 1D arrays with encoded punctuation labels
+        capit_labels: a list of 1D arrays with encoded capitalization labels
+        length: a length of padded sequence. Has to be greater or equal to the maximum length of a query
+        pad_id: a value used for padding ``input_ids``
+        punct_pad_id: a value used for padding ``punct_labels``
+        capit_pad_id: a value used for padding ``capit_labels``
+
+    Returns:
+        padded input ids, subtokens mask, punctuation labels, capitalization labels
+    """
+    batch_input_ids = np.full([len(input_ids), length], pad_id, dtype=np.int32)
+    batch_subtokens_mask = np.zeros([len(input_ids), length], dtype=bool)
+    batch_punct_labels = np.full([len(input_ids), length], punct_pad_id, dtype=np.int64)
+    batch_capit_labels = np.full([len(input_ids), length], capit_pad_id, dtype=np.int64)
+    for i, (inp, mask, punct, capit) in enumerate(zip(input_ids, subtokens_mask, punct_labels, capit_labels)):
+        batch_input_ids[i, : inp.shape[0]] = inp
+        batch_subtokens_mask[i, : mask.shape[0]] = mask
+        batch_punct_labels[i, : punct.shape[0]] = punct
+        batch_capit_labels[i, : capit.shape[0]] = capit
+    return batch_input_ids, batch_subtokens_mask, batch_punct_labels, batch_capit_labels
 
 
 class BertPunctuationCapitalizationDataset(Dataset):
@@ -1165,7 +1350,7 @@ class BertPunctuationCapitalizationDataset(Dataset):
                 suffix='.pkl', prefix=os.path.basename(self.features_pkl), dir=os.path.dirname(self.features_pkl)
             )
             with os.fdopen(ofd, 'wb') as temp_f:
-                pickle.dump(tuple(list(features) + [punct_label_ids, capit_label_ids]), temp_f)
+                pickle.dump(_flatten_features(features) + (punct_label_ids, capit_label_ids), temp_f)
 
             os.rename(tmp_features_pkl, self.features_pkl)
 
@@ -1184,11 +1369,11 @@ class BertPunctuationCapitalizationDataset(Dataset):
                 punct_label_ids, capit_label_ids, *li, punct_label_vocab_file, capit_label_vocab_file
             )
             punct_label_ids, capit_label_ids = li[-2], li[-1]
+            features = _restore_cached_features(features[:-2])
             if tokenization_progress_queue is not None:
                 tokenization_progress_queue.put(len(features[0]))
             if self.verbose:
                 logging.info(f'Features restored from {self.features_pkl}')
-            features = features[:-2]
 
         (
             self.input_ids,
@@ -1203,8 +1388,12 @@ class BertPunctuationCapitalizationDataset(Dataset):
         self.number_of_batches_is_multiple_of = number_of_batches_is_multiple_of
         self.batch_shuffling_random_state = np.random.RandomState(batch_shuffling_random_seed)
         if get_label_frequencies:
-            self.punct_label_frequencies = self._calculate_and_save_label_frequencies(self.punct_labels, 'punct')
-            self.capit_label_frequencies = self._calculate_and_save_label_frequencies(self.capit_labels, 'capit')
+            self.punct_label_frequencies = self._calculate_and_save_label_frequencies(
+                self.punct_labels, self.punct_label_ids, 'punct'
+            )
+            self.capit_label_frequencies = self._calculate_and_save_label_frequencies(
+                self.capit_labels, self.capit_label_ids, 'capit'
+            )
         if self.use_bucketing:
             self.batches = self._pack_into_batches(
                 input_ids=self.input_ids,
@@ -1389,10 +1578,13 @@ class BertPunctuationCapitalizationDataset(Dataset):
         with labels_file.open() as f:
             for i, line in enumerate(f):
                 pairs = line.split()
-                if not all([len(p) == 2 for p in pairs]):
+                # Punctuation and capitalization labels of a line are taken below with string slicing instead of
+                # unzipping the pairs. Slicing is correct only if every pair consists of exactly 2 characters
+                wrong_pair = next((p for p in pairs if len(p) != 2), None)
+                if wrong_pair is not None:
                     raise ValueError(
                         f"Some label pairs are not pairs but have wrong length (!= 2) in line {i} in label file "
-                        f"{labels_file}"
+                        f"{labels_file}. The first wrong pair is '{wrong_pair}'"
                     )
                 words = text_lines[i].split()
                 if len(pairs) != len(words):
@@ -1400,7 +1592,8 @@ class BertPunctuationCapitalizationDataset(Dataset):
                         f"In line {i} in text file {text_file} number of words {len(words)} is not equal to the "
                         f"number of labels {len(pairs)} in labels file {labels_file}."
                     )
-                punct_line, capit_line = zip(*pairs)
+                labels = ''.join(pairs)
+                punct_line, capit_line = labels[::2], labels[1::2]
                 punct_labels_lines.append(punct_line)
                 capit_labels_lines.append(capit_line)
                 punct_unique_labels.update(punct_line)
@@ -1444,12 +1637,12 @@ class BertPunctuationCapitalizationDataset(Dataset):
     def calc_batch_seq_length(queries: List[np.ndarray], length_is_multiple_of: int) -> int:
         return ceil(max([len(elem) for elem in queries]) / length_is_multiple_of) * length_is_multiple_of
 
+    @staticmethod
+    def _calc_batch_seq_length_from_lengths(lengths: np.ndarray, length_is_multiple_of: int) -> int:
+        return ceil(lengths.max() / length_is_multiple_of) * length_is_multiple_of
+
     def _adjust_number_of_batches(
-        self,
-        input_ids: List[np.ndarray],
-        batch_beginnings: List[int],
-        batch_sizes: List[int],
-        batch_seq_lengths: List[int],
+        self, lengths: np.ndarray, batch_beginnings: List[int], batch_sizes: List[int], batch_seq_lengths: List[int],
     ) -> Tuple[List[int], List[int], List[int]]:
         """
         If length of ``batch_sizes`` list is not divisible by ``self.number_of_batches_is_multiple_of``, then
@@ -1465,7 +1658,7 @@ class BertPunctuationCapitalizationDataset(Dataset):
         If dataset is too small to create enough batches, then a warning is shown.
 
         Args:
-            input_ids: tokenized queries of the dataset. `input_ids` are expected to be sorted by length in ascending
+            lengths: numbers of tokens in queries of the dataset. `lengths` are expected to be sorted in ascending
                 order.
             batch_beginnings: indices of first elements of batches created inside :meth:`_mark_up_batches` method.
                 Expected to be sorted in ascending order.
@@ -1474,7 +1667,7 @@ class BertPunctuationCapitalizationDataset(Dataset):
                 method.
 
         Returns:
-            batch_beginnings: a list of indices in ``input_ids`` of first samples of every batch
+            batch_beginnings: a list of indices in ``lengths`` of first samples of every batch
             batch_sizes: a list of numbers of samples in batches
             batch_seq_lengths: a list of sequence lengths after padding for every batch
         """
@@ -1510,15 +1703,17 @@ class BertPunctuationCapitalizationDataset(Dataset):
                         batch_sizes.append(ss)
                         batch_beginnings.append(bb + rb)
                         batch_seq_lengths.append(
-                            self.calc_batch_seq_length(input_ids[bb + rb : bb + rb + ss], length_is_multiple_of=8)
+                            self._calc_batch_seq_length_from_lengths(
+                                lengths[bb + rb : bb + rb + ss], length_is_multiple_of=8
+                            )
                         )
                         rb += ss
                         num_cut += 1
-                    assert len(input_ids[bb + rb : bb + bs]) > 0
+                    assert len(lengths[bb + rb : bb + bs]) > 0
                     batch_sizes[original_batch_index] = bs - rb
                     batch_beginnings[original_batch_index] = bb + rb
-                    batch_seq_lengths[original_batch_index] = self.calc_batch_seq_length(
-                        input_ids[bb + rb : bb + bs], length_is_multiple_of=8
+                    batch_seq_lengths[original_batch_index] = self._calc_batch_seq_length_from_lengths(
+                        lengths[bb + rb : bb + bs], length_is_multiple_of=8
                     )
                 original_batch_index -= 1
             # Keeping order of batches.
@@ -1530,10 +1725,10 @@ class BertPunctuationCapitalizationDataset(Dataset):
         assert len(batch_seq_lengths) % self.number_of_batches_is_multiple_of == 0
         return batch_beginnings, batch_sizes, batch_seq_lengths
 
-    def _mark_up_batches(self, input_ids: List[np.ndarray]) -> Tuple[List[int], List[int], List[int]]:
+    def _mark_up_batches(self, lengths: np.ndarray) -> Tuple[List[int], List[int], List[int]]:
         """
-        Computes indices of first samples in batch, batch sizes, seq lengths for batches. ``input_ids`` has to be
-        sorted by number of tokens in ascending order.
+        Computes indices of first samples in batch, batch sizes, seq lengths for batches. ``lengths`` has to be
+        sorted in ascending order.
 
         Batches are marked up with respect to following conditions:
             - total number of tokens in batch including paddings is less or equal to ``self.tokens_in_batch``
@@ -1544,25 +1739,38 @@ class BertPunctuationCapitalizationDataset(Dataset):
         ``self.batch_mark_up_progress_queue``. Otherwise, ``tqdm`` instance is created in this function.
 
         Args:
-            input_ids: a list of 1D int32 arrays. Elements of ``input_ids`` have to be sorted by length in ascending
-                order
+            lengths: a 1D integer array with numbers of tokens in queries. It has to be sorted in ascending order
 
         Returns:
-            batch_beginnings: a list of indices in ``input_ids`` of first samples of every batch
+            batch_beginnings: a list of indices in ``lengths`` of first samples of every batch
             batch_sizes: a list of numbers of samples in batches
             batch_seq_lengths: a list of sequence lengths after padding for every batch
         """
         batch_beginnings, batch_sizes, batch_seq_lengths = [], [], []
+        padded_lengths = (lengths + 7) // 8 * 8
         current_max_length = 0
         start = 0
+        # Index of the first query which has not been checked yet
+        i = 0
         if self.batch_mark_up_progress_queue is None:
-            inp_iterator = tqdm(enumerate(input_ids), total=len(input_ids), desc="Batch mark up", unit="query")
+            progress_bar = tqdm(total=len(lengths), desc="Batch mark up", unit="query")
         else:
-            inp_iterator = enumerate(input_ids)
             progress_made = 0
-        for i, inp in inp_iterator:
-            current_max_length = max(current_max_length, ceil(len(inp) / 8) * 8)
-            if current_max_length * (i + 1 - start) > self.tokens_in_batch:
+        while i < len(lengths):
+            # A query with index `j` overflows a batch if ``max_length * (j + 1 - start) > self.tokens_in_batch``.
+            # ``max_length`` is at least ``min_max_length`` so the first overflow is found among first
+            # ``self.tokens_in_batch // min_max_length + 1`` queries of a batch.
+            min_max_length = max(current_max_length, padded_lengths[i])
+            end = min(len(lengths), max(start + self.tokens_in_batch // min_max_length + 1, i + 1))
+            max_lengths = np.maximum.accumulate(np.maximum(padded_lengths[i:end], current_max_length))
+            overflow = np.flatnonzero(max_lengths * np.arange(i + 1 - start, end + 1 - start) > self.tokens_in_batch)
+            if len(overflow) == 0:
+                checked = end - i
+                i = end
+            else:
+                checked = overflow[0] + 1
+                current_max_length = max_lengths[overflow[0]]
+                i += overflow[0]
                 batch_size = (i - start) // 8 * 8
                 if batch_size == 0:
                     if i > start:
@@ -1580,36 +1788,37 @@ class BertPunctuationCapitalizationDataset(Dataset):
                             f"{self.tokens_in_batch} tokens. Sequence number {i - 1} will not be added to batches."
                         )
                         start = i
-                        current_max_length = ceil(len(inp) / 8) * 8
-                        continue
-                seq_length = self.calc_batch_seq_length(input_ids[start : start + batch_size], length_is_multiple_of=8)
-                batch_beginnings.append(start)
-                batch_sizes.append(batch_size)
-                batch_seq_lengths.append(seq_length)
-                start += batch_size
-                current_max_length = self.calc_batch_seq_length(input_ids[start : i + 1], length_is_multiple_of=8)
-            if self.batch_mark_up_progress_queue is not None:
-                progress_made += 1
+                        current_max_length = padded_lengths[i]
+                        batch_size = 0
+                if batch_size > 0:
+                    batch_beginnings.append(start)
+                    batch_sizes.append(batch_size)
+                    batch_seq_lengths.append(int(padded_lengths[start : start + batch_size].max()))
+                    start += batch_size
+                    current_max_length = padded_lengths[start : i + 1].max()
+                i += 1
+            if self.batch_mark_up_progress_queue is None:
+                progress_bar.update(checked)
+            else:
+                progress_made += checked
                 if progress_made >= BATCH_MARK_UP_PROGRESS_REPORT_PERIOD:
                     self.batch_mark_up_progress_queue.put(progress_made)
                     progress_made = 0
-        if start < len(input_ids):
-            seq_length = self.calc_batch_seq_length(input_ids[start:], length_is_multiple_of=8)
+        if self.batch_mark_up_progress_queue is None:
+            progress_bar.close()
+        if start < len(lengths):
             batch_beginnings.append(start)
-            batch_sizes.append(len(input_ids) - start)
-            batch_seq_lengths.append(seq_length)
+            batch_sizes.append(len(lengths) - start)
+            batch_seq_lengths.append(int(padded_lengths[start:].max()))
             if self.batch_mark_up_progress_queue is not None:
                 self.batch_mark_up_progress_queue.put(progress_made)
         if len(batch_beginnings) % self.number_of_batches_is_multiple_of:
             batch_beginnings, batch_sizes, batch_seq_lengths = self._adjust_number_of_batches(
-                input_ids, batch_beginnings, batch_sizes, batch_seq_lengths
-            )
-        assert sum(batch_sizes) == len(input_ids)
-        for i in range(len(batch_beginnings) - 1):
-            assert batch_beginnings[i] + batch_sizes[i] == batch_beginnings[i + 1]
-            assert batch_seq_lengths[i] >= max(
-                [len(inp) for inp in input_ids[batch_beginnings[i] : batch_beginnings[i] + batch_sizes[i]]]
+                lengths, batch_beginnings, batch_sizes, batch_seq_lengths
             )
+        assert sum(batch_sizes) == len(lengths)
+        assert np.all(np.diff(batch_beginnings) == batch_sizes[:-1])
+        assert np.all(np.array(batch_seq_lengths) >= np.maximum.reduceat(lengths, batch_beginnings))
         return batch_beginnings, batch_sizes, batch_seq_lengths
 
     def _form_batches(
@@ -1625,11 +1834,11 @@ class BertPunctuationCapitalizationDataset(Dataset):
         """
 
         Args:
-            input_ids: a list of 1D int32 arrays which contain token ids of dataset source
+            input_ids: a list of 1D uint16 or int32 arrays which contain token ids of dataset source
             subtokens_mask: a list of 1D boolean arrays which elements are ``True`` if corresponding token is the
                 first token in some word
-            punct_labels: a list of 1D int32 arrays which contain encoded punctuation labels
-            capit_labels: a list of 1D int32 arrays which contain encoded capitalization labels
+            punct_labels: a list of 1D int8 or int32 arrays which contain encoded punctuation labels
+            capit_labels: a list of 1D int8 or int32 arrays which contain encoded capitalization labels
             waveforms:  a list of 1D float arrays which contain raw waveforms of audios.
             audio_lengths: a list of 1D int32 arrays which contain length of corresponding audio from `waveforms`
             audio_filepaths: a list of strings which contain paths to audio
@@ -1669,7 +1878,7 @@ class BertPunctuationCapitalizationDataset(Dataset):
 
         for item in zipped:
             batch = {
-                "input_ids": item[0],
+                "input_ids": item[0].astype(np.int32),
                 "subtokens_mask": item[1],
                 "punct_labels": item[2].astype(np.int64),
                 "capit_labels": item[3].astype(np.int64),
@@ -1708,11 +1917,11 @@ class BertPunctuationCapitalizationDataset(Dataset):
         method.
 
         Args:
-            input_ids: a list of 1D int32 arrays which contain token ids of dataset source
+            input_ids: a list of 1D uint16 or int32 arrays which contain token ids of dataset source
             subtokens_mask: a list of 1D boolean arrays which elements are ``True`` if corresponding token is the
                 first token in some word
-            punct_labels: a list of 1D int32 arrays which contain encoded punctuation labels
-            capit_labels: a list of 1D int32 arrays which contain encoded capitalization labels
+            punct_labels: a list of 1D int8 or int32 arrays which contain encoded punctuation labels
+            capit_labels: a list of 1D int8 or int32 arrays which contain encoded capitalization labels
             waveforms:  a list of 1D float arrays which contain raw waveforms of audios.
             audio_lengths: a list of 1D int32 arrays which contain length of corresponding audio from `waveforms`
             audio_filepaths: a list of strings which contain paths to audio
@@ -1735,26 +1944,28 @@ class BertPunctuationCapitalizationDataset(Dataset):
 
             The values of a batch dictionary are numpy arrays of identical shape.
         """
-        dummy = [None] * len(input_ids)
-        zipped = list(
-            zip(
+        lengths = np.array([len(inp) for inp in input_ids], dtype=np.int64)
+        if self.use_audio and self.preload_audios:
+            sort_keys = np.array([len(waveform) for waveform in waveforms], dtype=np.int64)
+        else:
+            sort_keys = lengths
+        order = np.arange(len(input_ids))
+        self.batch_shuffling_random_state.shuffle(order)
+        order = order[np.argsort(sort_keys[order], kind='stable')]
+        lengths = lengths[order]
+        input_ids, subtokens_mask, punct_labels, capit_labels, waveforms, audio_lengths, audio_filepaths = [
+            [feature[i] for i in order] if feature else feature
+            for feature in [
                 input_ids,
                 subtokens_mask,
                 punct_labels,
                 capit_labels,
-                waveforms if waveforms else dummy,
-                audio_lengths if audio_lengths else dummy,
-                audio_filepaths if audio_filepaths else dummy,
-            )
-        )
-        self.batch_shuffling_random_state.shuffle(zipped)
-
-        dim_sort = 4 if self.use_audio and self.preload_audios else 0
-
-        input_ids, subtokens_mask, punct_labels, capit_labels, waveforms, audio_lengths, audio_filepaths = zip(
-            *sorted(zipped, key=lambda x: x[dim_sort].shape[0])
-        )
-        batch_beginnings, batch_sizes, batch_seq_lengths = self._mark_up_batches(input_ids)
+                waveforms,
+                audio_lengths,
+                audio_filepaths,
+            ]
+        ]
+        batch_beginnings, batch_sizes, batch_seq_lengths = self._mark_up_batches(lengths)
         batches = []
         if self.batch_building_progress_queue is None:
             inp_iterator = tqdm(
@@ -1768,17 +1979,21 @@ class BertPunctuationCapitalizationDataset(Dataset):
             inp_iterator = zip(batch_beginnings, batch_sizes, batch_seq_lengths)
             progress_made = 0
         for start, size, length in inp_iterator:
-            batch_input_ids = pad(input_ids[start : start + size], length, self.tokenizer.pad_id)
-            batch_subtokens_mask = pad(subtokens_mask[start : start + size], length, False)
+            batch_input_ids, batch_subtokens_mask, batch_punct_labels, batch_capit_labels = _pad_text_features(
+                input_ids[start : start + size],
+                subtokens_mask[start : start + size],
+                punct_labels[start : start + size],
+                capit_labels[start : start + size],
+                length,
+                self.tokenizer.pad_id,
+                self.punct_label_ids[self.pad_label],
+                self.capit_label_ids[self.pad_label],
+            )
             batch = {
                 "input_ids": batch_input_ids,
                 "subtokens_mask": batch_subtokens_mask,
-                "punct_labels": pad(
-                    punct_labels[start : start + size], length, self.punct_label_ids[self.pad_label]
-                ).astype(np.int64),
-                "capit_labels": pad(
-                    capit_labels[start : start + size], length, self.capit_label_ids[self.pad_label]
-                ).astype(np.int64),
+                "punct_labels": batch_punct_labels,
+                "capit_labels": batch_capit_labels,
             }
             if self.use_audio and self.preload_audios:
                 batch['features'] = pad(
@@ -1827,9 +2042,20 @@ class BertPunctuationCapitalizationDataset(Dataset):
             self.audio_filepaths,
         )
 
-    def _calculate_and_save_label_frequencies(self, all_labels: List[np.ndarray], name: str) -> Dict[str, float]:
+    def _calculate_and_save_label_frequencies(
+        self, all_labels: List[np.ndarray], label_ids: Dict[str, int], name: str
+    ) -> Dict[str, float]:
         """Calculates and saves labels frequencies in :attr:`label_info_save_dir`."""
-        merged_labels = itertools.chain.from_iterable(all_labels)
+        # Labels are counted in NumPy. ``get_label_stats`` builds a ``Counter`` from its input, so passing a mapping
+        # from labels to their counts is equivalent to passing all labels. Like in a ``Counter``, labels which are not
+        # present in the dataset are not included
+        label_counts = np.bincount(
+            np.concatenate(all_labels) if all_labels else np.zeros([0], dtype=np.int64), minlength=len(label_ids)
+        )
+        merged_labels = {label: int(count) for label, count in enumerate(label_counts) if count > 0}
+        if not merged_labels:
+            logging.warning(f"No {name} labels found in the dataset. Label frequencies are not computed.")
+            return {}
         if self.verbose:
             logging.info('Three most popular labels')
         self.label_info_save_dir.mkdir(parents=True, exist_ok=True)
@@ -34,7 +34,14 @@ def get_features_infer(
     step: Optional[int] = 8,
     margin: Optional[int] = 16,
 ) -> Tuple[
-    List[List[int]], List[List[int]], List[List[int]], List[List[int]], List[int], List[int], List[bool], List[bool],
+    List[np.ndarray],
+    List[np.ndarray],
+    List[np.ndarray],
+    List[np.ndarray],
+    List[int],
+    List[int],
+    List[bool],
+    List[bool],
 ]:
     """
     Processes the data and returns features.
@@ -58,7 +65,8 @@ def get_features_infer(
             ['[CLS]'*, 'e'*, 'l', 'l'*, '[SEP]'*], ['[CLS]'*, 'l'*, 'l', 'o', '[SEP]'*]]``.
 
     Returns:
-        all_input_ids: list of input ids of all segments
+        all_input_ids: list of input ids of all segments. Input ids, segment ids, input mask, and subtokens mask of
+            segments are 1D views of 2D arrays which are preallocated for all segments
         all_segment_ids: token type ids of all segments
         all_input_mask: attention mask to use for BERT model
         all_subtokens_mask: masks out all subwords besides the first one
@@ -71,8 +79,18 @@ def get_features_infer(
     st = []
     stm = []
     sent_lengths = []
+    # Words are tokenized independently, so repeated words are tokenized once
+    word_tokens_cache = {}
+    hf_tokenizer = getattr(tokenizer, 'tokenizer', None)
+    if getattr(hf_tokenizer, 'is_fast', False):
+        # HuggingFace fast tokenizers encode a batch in parallel outside of GIL, so all distinct words are tokenized
+        # in one call and tokenization of queries is reduced to cache look ups
+        words = list(dict.fromkeys(itertools.chain.from_iterable(query.split() for query in queries)))
+        if words:
+            encodings = hf_tokenizer(words, add_special_tokens=False)
+            word_tokens_cache.update((word, encodings.tokens(i)) for i, word in enumerate(words))
     for i, query in enumerate(queries):
-        subtokens, subtokens_mask = _get_subtokens_and_subtokens_mask(query, tokenizer)
+        subtokens, subtokens_mask = _get_subtokens_and_subtokens_mask(query, tokenizer, word_tokens_cache)
         sent_lengths.append(len(subtokens))
         st.append(subtokens)
         stm.append(subtokens_mask)
@@ -90,34 +108,43 @@ def get_features_infer(
         step = min(length - margin * 2, step)
     logging.info(f'Max length: {max_seq_length}')
     get_stats(sent_lengths)
-    all_input_ids, all_segment_ids, all_subtokens_mask, all_input_mask, all_input_mask = [], [], [], [], []
+    # Indices of first subtokens of segments in queries
+    segment_starts = [np.arange(0, max(len(query_st), length) - length + step, step) for query_st in st]
+    num_segments = sum(len(starts) for starts in segment_starts)
+    cls_id, sep_id = tokenizer.tokens_to_ids([tokenizer.cls_token, tokenizer.sep_token])
+    input_ids = np.zeros([num_segments, max_seq_length], dtype=np.int64)
+    subtokens_mask = np.zeros([num_segments, max_seq_length], dtype=bool)
+    segment_lengths = np.zeros([num_segments], dtype=np.int64)
     all_quantities_of_preceding_words, all_query_ids, all_is_first, all_is_last = [], [], [], []
-    for q_i, query_st in enumerate(st):
-        q_inp_ids, q_segment_ids, q_subtokens_mask, q_inp_mask, q_quantities_of_preceding_words = [], [], [], [], []
-        for i in range(0, max(len(query_st), length) - length + step, step):
-            subtokens = [tokenizer.cls_token] + query_st[i : i + length] + [tokenizer.sep_token]
-            q_inp_ids.append(tokenizer.tokens_to_ids(subtokens))
-            q_segment_ids.append([0] * len(subtokens))
-            q_subtokens_mask.append([False] + stm[q_i][i : i + length] + [False])
-            q_inp_mask.append([True] * len(subtokens))
-            q_quantities_of_preceding_words.append(np.count_nonzero(stm[q_i][:i]))
-        all_input_ids.append(q_inp_ids)
-        all_segment_ids.append(q_segment_ids)
-        all_subtokens_mask.append(q_subtokens_mask)
-        all_input_mask.append(q_inp_mask)
-        all_quantities_of_preceding_words.append(q_quantities_of_preceding_words)
-        all_query_ids.append([q_i] * len(q_inp_ids))
-        all_is_first.append([True] + [False] * (len(q_inp_ids) - 1))
-        all_is_last.append([False] * (len(q_inp_ids) - 1) + [True])
+    row = 0
+    for q_i, (query_st, starts) in enumerate(zip(st, segment_starts)):
+        query_ids = np.array(tokenizer.tokens_to_ids(query_st), dtype=np.int64)
+        for i in starts:
+            # Number of word subtokens in a segment
+            n = min(length, len(query_st) - i)
+            input_ids[row, 0] = cls_id
+            input_ids[row, 1 : n + 1] = query_ids[i : i + n]
+            input_ids[row, n + 1] = sep_id
+            subtokens_mask[row, 1 : n + 1] = stm[q_i][i : i + n]
+            segment_lengths[row] = n + 2
+            row += 1
+        # ``quantities_of_preceding_words[i]`` is a number of words which start before subtoken ``i``
+        quantities_of_preceding_words = np.concatenate([[0], np.cumsum(stm[q_i])])
+        all_quantities_of_preceding_words.extend(quantities_of_preceding_words[starts].tolist())
+        all_query_ids.extend([q_i] * len(starts))
+        all_is_first.extend([True] + [False] * (len(starts) - 1))
+        all_is_last.extend([False] * (len(starts) - 1) + [True])
+    segment_ids = np.zeros([num_segments, max_seq_length], dtype=np.int64)
+    input_mask = np.arange(max_seq_length) < segment_lengths[:, np.newaxis]
     return (
-        list(itertools.chain(*all_input_ids)),
-        list(itertools.chain(*all_segment_ids)),
-        list(itertools.chain(*all_input_mask)),
-        list(itertools.chain(*all_subtokens_mask)),
-        list(itertools.chain(*all_quantities_of_preceding_words)),
-        list(itertools.chain(*all_query_ids)),
-        list(itertools.chain(*all_is_first)),
-        list(itertools.chain(*all_is_last)),
+        [input_ids[r, :n] for r, n in enumerate(segment_lengths)],
+        [segment_ids[r, :n] for r, n in enumerate(segment_lengths)],
+        [input_mask[r, :n] for r, n in enumerate(segment_lengths)],
+        [subtokens_mask[r, :n] for r, n in enumerate(segment_lengths)],
+        all_quantities_of_preceding_words,
+        all_query_ids,
+        all_is_first,
+        all_is_last,
     )
 
 
@@ -152,7 +179,9 @@ def _check_max_seq_length_and_margin_and_step(max_seq_length: int, margin: int,
         )
 
 
-def _get_subtokens_and_subtokens_mask(query: str, tokenizer: TokenizerSpec) -> Tuple[List[str], List[bool]]:
+def _get_subtokens_and_subtokens_mask(
+    query: str, tokenizer: TokenizerSpec, word_tokens_cache: Optional[Dict[str, List[str]]] = None
+) -> Tuple[List[str], np.ndarray]:
     """
     Tokenizes input query into subtokens and creates subtokens mask. Subtokens mask is an array of the same length as
     subtokens array and contains zeros and ones in which. If element of mask equals 1, then corresponding subtoken in
@@ -160,18 +189,27 @@ def _get_subtokens_and_subtokens_mask(query: str, tokenizer: TokenizerSpec) -> T
     Args:
         query: a string that will be tokenized
         tokenizer: an instance of tokenizer
+        word_tokens_cache: a dictionary which maps words to their subtokens. If provided, then every distinct word is
+            tokenized only once and the dictionary is updated with new words
     Returns:
         subtokens: list of subtokens
-        subtokens_mask: list of ints
+        subtokens_mask: boolean numpy array
     """
     words = query.strip().split()
-    subtokens = []
-    subtokens_mask = []
-    for j, word in enumerate(words):
-        word_tokens = tokenizer.text_to_tokens(word)
-        subtokens.extend(word_tokens)
-        subtokens_mask.append(True)
-        subtokens_mask.extend([False] * (len(word_tokens) - 1))
+    if word_tokens_cache is None:
+        word_tokens = [tokenizer.text_to_tokens(word) for word in words]
+    else:
+        word_tokens = []
+        for word in words:
+            tokens = word_tokens_cache.get(word)
+            if tokens is None:
+                tokens = word_tokens_cache[word] = tokenizer.text_to_tokens(word)
+            word_tokens.append(tokens)
+    word_lengths = np.array([len(tokens) for tokens in word_tokens], dtype=np.int64)
+    subtokens = list(itertools.chain.from_iterable(word_tokens))
+    subtokens_mask = np.zeros(len(subtokens), dtype=bool)
+    # Words which are tokenized into zero subtokens do not get a mark in the mask
+    subtokens_mask[(np.cumsum(word_lengths) - word_lengths)[word_lengths > 0]] = True
     return subtokens, subtokens_mask
 
 
@@ -231,10 +269,10 @@ class BertPunctuationCapitalizationInferDataset(Dataset):
         features = get_features_infer(
             queries=queries, max_seq_length=max_seq_length, tokenizer=tokenizer, step=step, margin=margin
         )
-        self.all_input_ids: List[List[int]] = features[0]
-        self.all_segment_ids: List[List[int]] = features[1]
-        self.all_input_mask: List[List[int]] = features[2]
-        self.all_subtokens_mask: List[List[int]] = features[3]
+        self.all_input_ids: List[np.ndarray] = features[0]
+        self.all_segment_ids: List[np.ndarray] = features[1]
+        self.all_input_mask: List[np.ndarray] = features[2]
+        self.all_subtokens_mask: List[np.ndarray] = features[3]
         self.all_quantities_of_preceding_words: List[int] = features[4]
         self.all_query_ids: List[int] = features[5]
         self.all_is_first: List[bool] = features[6]
@@ -282,10 +320,10 @@ class BertPunctuationCapitalizationInferDataset(Dataset):
         """
         inp_ids, segment_ids, inp_mask, st_mask, n_preceding, query_ids, is_first, is_last = zip(*batch)
         return (
-            pad_sequence([torch.tensor(x) for x in inp_ids], batch_first=True, padding_value=0),
-            pad_sequence([torch.tensor(x) for x in segment_ids], batch_first=True, padding_value=0),
-            pad_sequence([torch.tensor(x) for x in inp_mask], batch_first=True, padding_value=0),
-            pad_sequence([torch.tensor(x) for x in st_mask], batch_first=True, padding_value=0),
+            pad_sequence([torch.from_numpy(x) for x in inp_ids], batch_first=True, padding_value=0),
+            pad_sequence([torch.from_numpy(x) for x in segment_ids], batch_first=True, padding_value=0),
+            pad_sequence([torch.from_numpy(x) for x in inp_mask], batch_first=True, padding_value=0),
+            pad_sequence([torch.from_numpy(x) for x in st_mask], batch_first=True, padding_value=0),
             n_preceding,
             query_ids,
             is_first,
@@ -323,10 +361,10 @@ class BertPunctuationCapitalizationInferDataset(Dataset):
                   segment in a query is not removed.
         """
         return (
-            np.array(self.all_input_ids[idx]),
-            np.array(self.all_segment_ids[idx]),
-            np.array(self.all_input_mask[idx], dtype=np.float32),
-            np.array(self.all_subtokens_mask[idx]),
+            self.all_input_ids[idx],
+            self.all_segment_ids[idx],
+            self.all_input_mask[idx].astype(np.float32),
+            self.all_subtokens_mask[idx],
             self.all_quantities_of_preceding_words[idx],
             self.all_query_ids[idx],
             self.all_is_first[idx],
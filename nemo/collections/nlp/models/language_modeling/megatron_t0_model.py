@@ -16,6 +16,7 @@ from pytorch_lightning.trainer.trainer import Trainer
 
 from nemo.collections.common.data import ConcatMapDataset
 from nemo.collections.nlp.data.language_modeling.t0_dataset import T0JSONLMemMapDataset
+from nemo.collections.nlp.data.language_modeling.text_memmap_dataset import build_index_files_on_rank_zero
 from nemo.collections.nlp.models.language_modeling.megatron_finetune_model import MegatronT5FinetuneModel
 from nemo.utils import logging
 
@@ -48,6 +49,8 @@ class MegatronT0Model(MegatronT5FinetuneModel):
         is_list_config = isinstance(data_cfg.file_names, ListConfig)
         if not is_list_config:
             raise ValueError(f"T0 train/validation datasets must be provided as a list of individual JSONL files.")
+        # Index all task files with a single worker pool, instead of one pool per T0JSONLMemMapDataset.
+        build_index_files_on_rank_zero(list(data_cfg.file_names), newline_int=10)
         for file_name in data_cfg.file_names:
             dataset = T0JSONLMemMapDataset(
                 dataset_paths=[file_name],
@@ -103,14 +103,14 @@ class BIGLSTMPromptEncoder(NeuralModule, Exportable):
 
     @typecheck()
     def forward(self, taskname_embeddings) -> torch.Tensor:
-        input_embeds = self.embedding(self.indices).unsqueeze(0)
         batch_size, task_seq_length, _ = taskname_embeddings.shape
-        input_embeds = input_embeds.expand(batch_size, self.total_virtual_tokens, self.token_dim).clone()
         length = min(task_seq_length, self.total_virtual_tokens)
         # need to adapt taskname embedding hidden to the same size as hidden_size
-        taskname_embeddings = torch.matmul(taskname_embeddings, self.mlp_head[2].weight)
-        # Replace general input with task specific embeddings to specify the correct task
-        input_embeds[:, 0:length, :] = taskname_embeddings[:, 0:length, :]
+        taskname_embeddings = torch.matmul(taskname_embeddings[:, 0:length, :], self.mlp_head[2].weight)
+        # Replace general input with task specific embeddings to specify the correct task. The embeddings of the
+        # remaining virtual tokens are concatenated instead of cloning the whole expanded input and overwriting it.
+        input_embeds = self.embedding(self.indices[length:]).unsqueeze(0).expand(batch_size, -1, -1)
+        input_embeds = torch.cat([taskname_embeddings.to(input_embeds.dtype), input_embeds], dim=1)
 
         if self.encoder_type == PromptEncoderType.LSTM:
             output_embeds = self.mlp_head(self.lstm_head(input_embeds)[0])
@@ -189,12 +189,11 @@ class PromptEncoderMLP(NeuralModule, Exportable):
 
     @typecheck()
     def forward(self, taskname_embeddings) -> torch.Tensor:
-        input_embeds = self.embedding(self.indices).unsqueeze(0)
         batch_size, task_seq_length, _ = taskname_embeddings.shape
-        input_embeds = input_embeds.expand(batch_size, self.total_virtual_tokens, self.output_size).clone()
         length = min(task_seq_length, self.total_virtual_tokens)
         # Replace general input with task specific embeddings to specify the correct task
-        input_embeds[:, 0:length, :] = taskname_embeddings[:, 0:length, :]
+        input_embeds = self.embedding(self.indices[length:]).unsqueeze(0).expand(batch_size, -1, -1)
+        input_embeds = torch.cat([taskname_embeddings[:, 0:length, :].to(input_embeds.dtype), input_embeds], dim=1)
         intermediate_parallel, bias_parallel = self.first(input_embeds)
         intermediate_parallel = fused_bias_gelu(intermediate_parallel, bias_parallel)
         output_embeds, bias_parallel = self.second(intermediate_parallel)
@@ -284,13 +283,13 @@ class PromptEncoder(NeuralModule, Exportable):
 
     @typecheck()
     def forward(self, taskname_embeddings) -> torch.Tensor:
-        input_embeds = self.embedding(self.indices).unsqueeze(0)
         batch_size, task_seq_length, _ = taskname_embeddings.shape
-        input_embeds = input_embeds.expand(batch_size, self.total_virtual_tokens, self.token_dim).clone()
         length = min(task_seq_length, self.total_virtual_tokens)
 
-        # Replace general input with task specific embeddings to specify the correct task
-        input_embeds[:, 0:length, :] = taskname_embeddings[:, 0:length, :]
+        # Replace general input with task specific embeddings to specify the correct task. The embeddings of the
+        # remaining virtual tokens are concatenated instead of cloning the whole expanded input and overwriting it.
+        input_embeds = self.embedding(self.indices[length:]).unsqueeze(0).expand(batch_size, -1, -1)
+        input_embeds = torch.cat([taskname_embeddings[:, 0:length, :].to(input_embeds.dtype), input_embeds], dim=1)
 
         if self.encoder_type == PromptEncoderType.LSTM:
             output_embeds = self.mlp_head(self.lstm_head(input_embeds)[0])
@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import os
 import string
+import tempfile
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Union
 
@@ -94,6 +96,16 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
 
         self._setup_encoder()
         self.decoder = EncDecCTCModel.from_config_dict(self._cfg.decoder)
+        if self._cfg.get("compile", False):
+            if not hasattr(torch, "compile"):
+                raise ValueError(
+                    f"`model.compile=True` requires PyTorch 2.0 or newer whereas PyTorch {torch.__version__} is "
+                    f"installed."
+                )
+            # Forward methods are compiled instead of modules, so that state dict keys are not changed. The default
+            # mode is used because CUDA graphs of "reduce-overhead" mode overwrite outputs kept between steps
+            for module in [self.encoder, self.decoder]:
+                module.forward = torch.compile(module.forward, dynamic=True)
         self.loss = CTCLoss(
             num_classes=self.decoder.num_classes_with_blank - 1,
             zero_infinity=True,
@@ -137,10 +149,17 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
                 punctuation_marks = string.punctuation.replace('"', "").replace("\\", "").replace("'", "")
                 chars += punctuation_marks
 
-            vocab_file = "/tmp/char_vocab.txt"
-            with open(vocab_file, "w") as f:
-                [f.write(f'"{ch}"\n') for ch in chars]
-                f.write('"\\""\n')  # add " to the vocab
+            vocab = ''.join(f'"{ch}"\n' for ch in chars) + '"\\""\n'  # add " to the vocab
+            # The vocab file is named after its content, so it is written only once and models with different
+            # vocabularies (or DDP processes) do not overwrite each other's files
+            vocab_file = os.path.join(
+                tempfile.gettempdir(), f"char_vocab_{hashlib.sha256(vocab.encode('utf-8')).hexdigest()}.txt"
+            )
+            if not os.path.exists(vocab_file):
+                fd, tmp_vocab_file = tempfile.mkstemp(dir=os.path.dirname(vocab_file), suffix=".txt")
+                with os.fdopen(fd, "w") as f:
+                    f.write(vocab)
+                os.replace(tmp_vocab_file, vocab_file)
 
             self.register_artifact("tokenizer_grapheme.vocab_file", vocab_file)
             grapheme_tokenizer = instantiate(cfg.tokenizer_grapheme.dataset, vocab_file=vocab_file)
@@ -177,6 +196,18 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
 
     # @typecheck()
     def forward(self, input_ids, attention_mask, input_len):
+        """
+        Args:
+            input_ids: grapheme token ids of shape [B, T]
+            attention_mask: attention mask of shape [B, T], used only by ByT5 encoder
+            input_len: lengths of ``input_ids`` of shape [B]
+
+        Returns:
+            log_probs: log probabilities of phoneme tokens of shape [B, T, V]
+            greedy_predictions: argmax labels of shape [B, T] in evaluation mode. In training mode ``None`` is
+                returned because the training loss needs only ``log_probs``, so call ``eval()`` before using them
+            encoded_len: lengths of ``log_probs`` of shape [B]
+        """
         if self.mode == "byt5":
             encoded_input = self.encoder(input_ids=input_ids, attention_mask=attention_mask)[0]
             encoded_len = input_len
@@ -191,14 +222,15 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
             raise ValueError(f"{self.mode} is not supported. Choose from {self.supported_modes}")
 
         log_probs = self.decoder(encoder_output=encoded_input)
-        greedy_predictions = log_probs.argmax(dim=-1, keepdim=False)
+        # Greedy predictions are not used by the training loss, so they are computed only in evaluation mode
+        greedy_predictions = None if self.training else log_probs.argmax(dim=-1, keepdim=False)
         return log_probs, greedy_predictions, encoded_len
 
     # ===== Training Functions ===== #
     def training_step(self, batch, batch_idx):
         input_ids, attention_mask, input_len, targets, target_lengths = batch
 
-        log_probs, predictions, encoded_len = self.forward(
+        log_probs, _, encoded_len = self.forward(
             input_ids=input_ids, attention_mask=attention_mask, input_len=input_len
         )
 
@@ -222,14 +254,15 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
             log_probs=log_probs, targets=targets, input_lengths=encoded_len, target_lengths=target_lengths
         )
 
+        predictions = self._get_predictions_for_decoding(log_probs, greedy_predictions)
         self._wer.update(
-            predictions=log_probs, targets=targets, target_lengths=target_lengths, predictions_lengths=encoded_len
+            predictions=predictions, targets=targets, target_lengths=target_lengths, predictions_lengths=encoded_len,
         )
         wer, wer_num, wer_denom = self._wer.compute()
         self._wer.reset()
 
         self._per.update(
-            predictions=log_probs, targets=targets, target_lengths=target_lengths, predictions_lengths=encoded_len
+            predictions=predictions, targets=targets, target_lengths=target_lengths, predictions_lengths=encoded_len,
         )
         per, per_num, per_denom = self._per.compute()
         self._per.reset()
@@ -245,6 +278,27 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
             f"{split}_per": per,
         }
 
+    def _get_predictions_for_decoding(
+        self, log_probs: torch.Tensor, greedy_predictions: Optional[torch.Tensor]
+    ) -> torch.Tensor:
+        """
+        Returns predictions which are passed to CTC decoding. For plain greedy decoding argmax labels are returned, so
+        that log probabilities of the whole vocabulary are not moved to CPU. If alignments are preserved, log
+        probabilities are returned because alignments and hypotheses scores are computed from log probabilities.
+
+        Args:
+            log_probs: log probabilities of shape [B, T, V]
+            greedy_predictions: argmax labels of shape [B, T] or ``None`` if :meth:`forward` was called in training
+                mode. In the latter case argmax labels are computed from ``log_probs``
+        Returns:
+            argmax labels or ``log_probs``
+        """
+        if self.decoding.preserve_alignments:
+            return log_probs
+        if greedy_predictions is None:
+            greedy_predictions = log_probs.argmax(dim=-1, keepdim=False)
+        return greedy_predictions
+
     def test_step(self, batch, batch_idx, dataloader_idx=0):
         """
         Lightning calls this inside the test loop with the data from the test dataloader
@@ -309,6 +363,7 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
             shuffle=False,
             num_workers=cfg.num_workers,
             drop_last=False,
+            pin_memory=torch.cuda.is_available(),
         )
 
     @torch.no_grad()
@@ -331,24 +386,36 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
             self.to(device)
 
             infer_datalayer = self._setup_infer_dataloader(config)
-
-            for batch in infer_datalayer:
-                input_ids, attention_mask, input_len = batch
-                log_probs, greedy_predictions, encoded_len = self.forward(
-                    input_ids=input_ids.to(device),
-                    attention_mask=attention_mask if attention_mask is None else attention_mask.to(device),
-                    input_len=input_len.to(device),
-                )
-
-                preds_str, _ = self.decoding.ctc_decoder_predictions_tensor(
-                    log_probs, decoder_lengths=encoded_len, return_hypotheses=False
-                )
-                all_preds.extend(preds_str)
-
-                del greedy_predictions
-                del log_probs
-                del batch
-                del input_len
+            # If enabled, run the model in BF16 on GPUs which support it. FP16 is not used as a fallback because T5
+            # based encoders overflow in half precision. Log probabilities are computed in FP32 by log_softmax under
+            # autocast
+            use_bf16 = self._cfg.get("infer_bf16", False) and device == 'cuda' and torch.cuda.is_bf16_supported()
+
+            # Inference mode is not used for the whole method because parameters moved by self.to(device) in inference
+            # mode would become inference tensors and could not be trained afterwards
+            with torch.inference_mode():
+                for batch in infer_datalayer:
+                    input_ids, attention_mask, input_len = batch
+                    with torch.autocast(device_type=device, dtype=torch.bfloat16, enabled=use_bf16):
+                        log_probs, greedy_predictions, encoded_len = self.forward(
+                            input_ids=input_ids.to(device, non_blocking=True),
+                            attention_mask=attention_mask
+                            if attention_mask is None
+                            else attention_mask.to(device, non_blocking=True),
+                            input_len=input_len.to(device, non_blocking=True),
+                        )
+
+                    preds_str, _ = self.decoding.ctc_decoder_predictions_tensor(
+                        self._get_predictions_for_decoding(log_probs, greedy_predictions),
+                        decoder_lengths=encoded_len,
+                        return_hypotheses=False,
+                    )
+                    all_preds.extend(preds_str)
+
+                    del greedy_predictions
+                    del log_probs
+                    del batch
+                    del input_len
         finally:
             # set mode back to its original value
             self.train(mode=mode)
@@ -375,7 +442,12 @@ class CTCG2PModel(G2PModel, ASRBPEMixin):
             with_labels=True,
         )
 
-        return torch.utils.data.DataLoader(dataset, collate_fn=dataset.collate_fn, **cfg.dataloader_params)
+        dataloader_params = OmegaConf.to_container(cfg.dataloader_params, resolve=True)
+        # Persistent workers are not allowed without worker processes, e.g. if `num_workers` is overridden with 0
+        dataloader_params["persistent_workers"] = (
+            dataloader_params.get("persistent_workers", False) and dataloader_params.get("num_workers", 0) > 0
+        )
+        return torch.utils.data.DataLoader(dataset, collate_fn=dataset.collate_fn, **dataloader_params)
 
     def setup_training_data(self, cfg: DictConfig):
         if not cfg or cfg.manifest_filepath is None:
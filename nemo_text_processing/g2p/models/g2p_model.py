@@ -60,12 +60,14 @@ class G2PModel(ModelPT, ABC):
         }
 
         all_preds = self._infer(DictConfig(config))
+        # json.dumps creates a new encoder on every call with non-default arguments, so one encoder is reused
+        encode_json = json.JSONEncoder(ensure_ascii=False).encode
         with open(manifest_filepath, "r") as f_in:
-            with open(output_manifest_filepath, 'w', encoding="utf-8") as f_out:
+            with open(output_manifest_filepath, 'w', encoding="utf-8", buffering=1 << 20) as f_out:
                 for i, line in tqdm(enumerate(f_in)):
                     line = json.loads(line)
                     line[pred_field] = all_preds[i]
-                    f_out.write(json.dumps(line, ensure_ascii=False) + "\n")
+                    f_out.write(encode_json(line) + "\n")
 
         logging.info(f"Predictions saved to {output_manifest_filepath}.")
         return all_preds
@@ -491,3 +491,76 @@ class TestWordErrorRate:
         assert hyp.text != ''
         assert len(hyp.timestep) == 3
         assert hyp.alignments is None
+
+    @staticmethod
+    def __reference_fold_consecutive(prediction: List[int], blank_id: int):
+        # Per frame CTC collapse which is used as a reference for the vectorized implementation
+        decoded_prediction, token_repetitions = [], []
+        previous = blank_id
+        last_repetition = 0
+        for pidx, p in enumerate(prediction):
+            if (p != previous or previous == blank_id) and p != blank_id:
+                decoded_prediction.append(p)
+                token_repetitions.append(pidx - last_repetition)
+                last_repetition = pidx
+            previous = p
+        return decoded_prediction, token_repetitions
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize(
+        "prediction",
+        [
+            [],
+            [28, 28, 28],
+            [1, 1, 1, 2, 2, 3],
+            [1, 28, 1, 28, 28, 1, 1],
+            [28, 5, 5, 28, 6, 28, 28, 6, 7, 7, 28],
+            [3, 28, 3, 3, 4, 28],
+        ],
+    )
+    @pytest.mark.parametrize("as_tensor", [True, False])
+    def test_char_decoding_fold_consecutive(self, prediction, as_tensor):
+        decoding_cfg = CTCDecodingConfig(compute_timestamps=True)
+        decoding = CTCDecoding(decoding_cfg, vocabulary=self.vocabulary)
+        blank_id = len(self.vocabulary)
+        y_sequence = torch.tensor(prediction, dtype=torch.long) if as_tensor else list(prediction)
+
+        hyp = decoding.decode_hypothesis([Hypothesis(score=0.0, y_sequence=y_sequence)], fold_consecutive=True)[0]
+        decoded_prediction, token_repetitions = hyp.text
+        assert decoded_prediction == self.__reference_fold_consecutive(prediction, blank_id)[0]
+        assert token_repetitions == self.__reference_fold_consecutive(prediction, blank_id)[1]
+
+    @pytest.mark.unit
+    def test_char_decoding_fold_consecutive_randomized(self):
+        decoding_cfg = CTCDecodingConfig(compute_timestamps=True)
+        decoding = CTCDecoding(decoding_cfg, vocabulary=self.vocabulary)
+        blank_id = len(self.vocabulary)
+        torch.manual_seed(0)
+        for _ in range(100):
+            T = torch.randint(1, 50, [1]).item()
+            # A small number of distinct labels produces many repeats and blanks between repeats
+            prediction = torch.randint(0, 4, [T])
+            prediction[prediction == 3] = blank_id
+            length = torch.randint(0, T + 1, [1]).item()
+
+            hyp = Hypothesis(score=0.0, y_sequence=prediction, length=length)
+            hyp = decoding.decode_hypothesis([hyp], fold_consecutive=True)[0]
+            # Zero length means that the whole sequence is decoded
+            expected = self.__reference_fold_consecutive(prediction[: length or T].tolist(), blank_id)
+            assert hyp.text == expected
+
+    @pytest.mark.unit
+    def test_char_decoding_labels_do_not_alias_input(self):
+        B, T, V = 2, 8, len(self.vocabulary)
+        torch.manual_seed(0)
+        decoder_outputs = torch.randint(0, V + 1, size=[B, T], dtype=torch.long)
+        decoder_outputs_copy = decoder_outputs.clone()
+        decoder_lens = torch.tensor([T, T // 2], dtype=torch.int32)
+
+        decoding_cfg = CTCDecodingConfig()
+        decoding = CTCDecoding(decoding_cfg, vocabulary=self.vocabulary)
+
+        hyps, _ = decoding.ctc_decoder_predictions_tensor(decoder_outputs, decoder_lens, return_hypotheses=True)
+        for hyp in hyps:
+            hyp.y_sequence.fill_(0)
+        assert torch.equal(decoder_outputs, decoder_outputs_copy)
@@ -0,0 +1,344 @@
+# Copyright (c) 2022, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from math import ceil
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from nemo.collections.nlp.data.token_classification.punctuation_capitalization_dataset import (
+    BertPunctuationCapitalizationDataset,
+    TokenizeCreateMasksClipWorker,
+    _flatten_features,
+    _restore_cached_features,
+    _unflatten_features,
+    create_masks_and_segment_ids,
+)
+
+PAD_ID, CLS_ID, SEP_ID = 0, 101, 102
+
+
+class TestCreateMasksAndSegmentIds:
+    # [CLS] w w [SEP] <pad>, the two word tokens belong to one word
+    input_ids = np.array([[CLS_ID, 5, 6, SEP_ID, PAD_ID]])
+    subtokens_mask = np.array([[False, True, False, False, False]])
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize(
+        "ignore_start_end,ignore_extra_tokens,expected_loss_mask",
+        [
+            (True, True, [0, 1, 0, 0, 0]),
+            (True, False, [0, 1, 1, 0, 0]),
+            (False, True, [1, 1, 0, 1, 0]),
+            (False, False, [1, 1, 1, 1, 0]),
+        ],
+    )
+    def test_loss_mask(self, ignore_start_end, ignore_extra_tokens, expected_loss_mask):
+        segment_ids, input_mask, loss_mask = create_masks_and_segment_ids(
+            self.input_ids, self.subtokens_mask, PAD_ID, CLS_ID, SEP_ID, ignore_start_end, ignore_extra_tokens
+        )
+        assert_array_equal(segment_ids, np.zeros([1, 5], dtype=np.int8))
+        assert_array_equal(input_mask, np.array([[True, True, True, True, False]]))
+        assert loss_mask.dtype == bool
+        assert_array_equal(loss_mask, np.array([expected_loss_mask], dtype=bool))
+
+
+def _make_features(lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    input_ids = [rng.integers(0, 30000, size=n).astype(np.int32) for n in lengths]
+    subtokens_mask = [rng.random(n) < 0.5 for n in lengths]
+    punct_labels = [rng.integers(0, 4, size=n).astype(np.int8) for n in lengths]
+    capit_labels = [rng.integers(0, 2, size=n).astype(np.int8) for n in lengths]
+    waveforms, waveforms_length, audio_filepaths = None, None, None
+    return input_ids, subtokens_mask, waveforms, waveforms_length, audio_filepaths, punct_labels, capit_labels
+
+
+def _assert_features_equal(features, expected):
+    assert len(features) == len(expected)
+    for field, expected_field in zip(features, expected):
+        if expected_field is None:
+            assert field is None
+            continue
+        assert len(field) == len(expected_field)
+        for arr, expected_arr in zip(field, expected_field):
+            assert arr.dtype == expected_arr.dtype
+            assert_array_equal(arr, expected_arr)
+
+
+class TestFeaturesCache:
+    @pytest.mark.unit
+    @pytest.mark.parametrize("lengths", [[3, 9, 1, 13], [8, 16], [5], [7, 0, 11]])
+    def test_flatten_unflatten_round_trip(self, lengths):
+        features = _make_features(lengths)
+        flat = _flatten_features(features)
+        # Subtokens mask is packed into bits, so its size is rounded up to whole bytes
+        assert flat[1].dtype == np.uint8
+        assert flat[1].shape == ((sum(lengths) + 7) // 8,)
+        assert_array_equal(flat[-1], np.cumsum([0] + lengths))
+        _assert_features_equal(_unflatten_features(flat), features)
+
+    @pytest.mark.unit
+    def test_restore_flattened_cache(self):
+        features = _make_features([3, 9, 1, 13])
+        _assert_features_equal(_restore_cached_features(_flatten_features(features)), features)
+
+    @pytest.mark.unit
+    def test_restore_legacy_list_cache(self):
+        # Older versions pickled features as lists of per query arrays
+        features = tuple(field if field is None else list(field) for field in _make_features([3, 9, 1, 13], seed=1))
+        _assert_features_equal(_restore_cached_features(features), features)
+
+    @pytest.mark.unit
+    def test_flatten_restore_empty(self):
+        features = ([], [], None, None, None, [], [])
+        assert _flatten_features(features) == features
+        assert _restore_cached_features(_flatten_features(features)) == features
+
+
+class _ProgressQueue:
+    def __init__(self):
+        self.progress = 0
+
+    def put(self, progress_made):
+        self.progress += progress_made
+
+
+class _CharPairTokenizer:
+    """Splits words into pieces of at most 2 characters. Character ``@`` is unknown and is dropped."""
+
+    pad_id, cls_id, sep_id, unk_id = 0, 1, 2, 3
+    vocab_size = 1000
+
+    def text_to_ids(self, text):
+        text = text.replace('@', '')
+        return [4 + sum(map(ord, text[i : i + 2])) % 900 for i in range(0, len(text), 2)]
+
+
+PUNCT_LABEL_IDS = {'O': 0, ',': 1, '.': 2, '?': 3}
+CAPIT_LABEL_IDS = {'O': 0, 'U': 1}
+
+
+def _reference_tokenize_create_masks_clip(tokenizer, queries, punct_label_lines, capit_label_lines, max_seq_length):
+    """A per token implementation of :class:`TokenizeCreateMasksClipWorker` which is used as a reference."""
+
+    def clip(values, append_value):
+        return values[: max_seq_length - 1] + [append_value] if len(values) > max_seq_length else values
+
+    result = [], [], [], []
+    for query, punct_line, capit_line in zip(queries, punct_label_lines, capit_label_lines):
+        input_ids, subtokens_mask, punct_labels, capit_labels = [tokenizer.cls_id], [False], [0], [0]
+        for word, punct_label, capit_label in zip(query.split(), punct_line, capit_line):
+            word_ids = tokenizer.text_to_ids(word) or [tokenizer.unk_id]
+            input_ids.extend(word_ids)
+            subtokens_mask.extend([True] + [False] * (len(word_ids) - 1))
+            punct_labels.extend([PUNCT_LABEL_IDS[punct_label]] * len(word_ids))
+            capit_labels.extend([CAPIT_LABEL_IDS[capit_label]] * len(word_ids))
+        result[0].append(clip(input_ids + [tokenizer.sep_id], tokenizer.sep_id))
+        result[1].append(clip(subtokens_mask + [False], False))
+        result[2].append(clip(punct_labels + [0], 0))
+        result[3].append(clip(capit_labels + [0], 0))
+    return result
+
+
+def _random_queries(rng, num_queries):
+    queries, punct_label_lines, capit_label_lines = [], [], []
+    for _ in range(num_queries):
+        words = [''.join(rng.choice(list('abcdefgh@'), size=rng.integers(1, 8))) for _ in range(rng.integers(1, 12))]
+        queries.append(' '.join(words))
+        punct_label_lines.append(''.join(rng.choice(list(PUNCT_LABEL_IDS), size=len(words))))
+        capit_label_lines.append(''.join(rng.choice(list(CAPIT_LABEL_IDS), size=len(words))))
+    return queries, punct_label_lines, capit_label_lines
+
+
+class TestTokenizeCreateMasksClipWorker:
+    def _create_worker(self, max_seq_length, progress_queue):
+        return TokenizeCreateMasksClipWorker(
+            max_seq_length, _CharPairTokenizer(), PUNCT_LABEL_IDS, CAPIT_LABEL_IDS, 'O', False, progress_queue
+        )
+
+    @pytest.mark.unit
+    def test_masks_labels_and_clipping(self):
+        progress_queue = _ProgressQueue()
+        worker = self._create_worker(7, progress_queue)
+        # "hello" -> 3 tokens, "my" -> 1 token, "@" -> [UNK], "friend" -> 3 tokens
+        input_ids, subtokens_mask, punct_labels, capit_labels, *_ = worker(
+            ["hello my @ friend", "hi"], ["O,.?", "."], ["UOOU", "U"], 0
+        )
+        assert progress_queue.progress == 2
+        assert input_ids[0].dtype == np.uint16 and punct_labels[0].dtype == np.int8
+        assert_array_equal(input_ids[0][[0, 4, 5, 6]], [1, 4 + ord('m') + ord('y'), 3, 2])
+        assert_array_equal(subtokens_mask[0], [0, 1, 0, 0, 1, 1, 0])
+        assert_array_equal(punct_labels[0], [0, 0, 0, 0, 1, 2, 0])
+        assert_array_equal(capit_labels[0], [0, 1, 1, 1, 0, 0, 0])
+        assert_array_equal(input_ids[1], [1, 4 + ord('h') + ord('i'), 2])
+        assert_array_equal(subtokens_mask[1], [0, 1, 0])
+        assert_array_equal(punct_labels[1], [0, 2, 0])
+        assert_array_equal(capit_labels[1], [0, 1, 0])
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize(
+        "vocab_size,special_ids,hf_tokenizer_len,id_dtype",
+        [
+            (1000, {}, None, np.uint16),
+            (65536, {}, None, np.uint16),
+            (65537, {}, None, np.int32),
+            (65530, {'unk_id': 65536}, None, np.int32),
+            (65536, {}, 65537, np.int32),
+            (0, {}, None, np.int32),
+        ],
+    )
+    def test_id_dtype(self, vocab_size, special_ids, hf_tokenizer_len, id_dtype):
+        tokenizer = _CharPairTokenizer()
+        tokenizer.vocab_size = vocab_size
+        for name, token_id in special_ids.items():
+            setattr(tokenizer, name, token_id)
+        if hf_tokenizer_len is not None:
+            tokenizer.tokenizer = [None] * hf_tokenizer_len
+        worker = TokenizeCreateMasksClipWorker(
+            64, tokenizer, PUNCT_LABEL_IDS, CAPIT_LABEL_IDS, 'O', False, _ProgressQueue()
+        )
+        assert worker.id_dtype == id_dtype
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("max_seq_length", [3, 4, 9, 64])
+    def test_matches_reference(self, max_seq_length):
+        rng = np.random.default_rng(max_seq_length)
+        queries, punct_label_lines, capit_label_lines = _random_queries(rng, 200)
+        worker = self._create_worker(max_seq_length, _ProgressQueue())
+        features = worker(queries, punct_label_lines, capit_label_lines, 0)[:4]
+        expected = _reference_tokenize_create_masks_clip(
+            _CharPairTokenizer(), queries, punct_label_lines, capit_label_lines, max_seq_length
+        )
+        for field, expected_field in zip(features, expected):
+            assert len(field) == len(expected_field)
+            for arr, expected_arr in zip(field, expected_field):
+                assert_array_equal(arr, expected_arr)
+
+
+def _reference_mark_up_batches(lengths, tokens_in_batch):
+    """A per query implementation of batch mark up which is used as a reference."""
+    batch_beginnings, batch_sizes, batch_seq_lengths = [], [], []
+    current_max_length, start = 0, 0
+    for i, length in enumerate(lengths):
+        current_max_length = max(current_max_length, ceil(length / 8) * 8)
+        if current_max_length * (i + 1 - start) > tokens_in_batch:
+            batch_size = (i - start) // 8 * 8
+            if batch_size == 0:
+                if i > start:
+                    batch_size = i - start
+                else:
+                    start = i
+                    current_max_length = ceil(length / 8) * 8
+                    continue
+            batch_beginnings.append(start)
+            batch_sizes.append(batch_size)
+            batch_seq_lengths.append(ceil(max(lengths[start : start + batch_size]) / 8) * 8)
+            start += batch_size
+            current_max_length = ceil(max(lengths[start : i + 1]) / 8) * 8
+    if start < len(lengths):
+        batch_beginnings.append(start)
+        batch_sizes.append(len(lengths) - start)
+        batch_seq_lengths.append(ceil(max(lengths[start:]) / 8) * 8)
+    return batch_beginnings, batch_sizes, batch_seq_lengths
+
+
+class TestMarkUpBatches:
+    def _create_dataset(self, tokens_in_batch, number_of_batches_is_multiple_of):
+        dataset = BertPunctuationCapitalizationDataset.__new__(BertPunctuationCapitalizationDataset)
+        dataset.tokens_in_batch = tokens_in_batch
+        dataset.batch_mark_up_progress_queue = None
+        dataset.number_of_batches_is_multiple_of = number_of_batches_is_multiple_of
+        return dataset
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("tokens_in_batch", [16, 100, 512, 5000])
+    @pytest.mark.parametrize("max_length", [3, 40, 130])
+    def test_matches_reference(self, tokens_in_batch, max_length):
+        rng = np.random.default_rng(tokens_in_batch + max_length)
+        lengths = np.sort(rng.integers(3, max_length + 1, size=1000))
+        dataset = self._create_dataset(tokens_in_batch, 1)
+        batch_beginnings, batch_sizes, batch_seq_lengths = dataset._mark_up_batches(lengths)
+        expected = _reference_mark_up_batches(lengths.tolist(), tokens_in_batch)
+        assert batch_beginnings == expected[0]
+        assert batch_sizes == expected[1]
+        assert batch_seq_lengths == expected[2]
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("number_of_batches_is_multiple_of", [2, 3, 8])
+    def test_number_of_batches_is_multiple_of(self, number_of_batches_is_multiple_of):
+        rng = np.random.default_rng(number_of_batches_is_multiple_of)
+        lengths = np.sort(rng.integers(3, 60, size=997))
+        dataset = self._create_dataset(512, number_of_batches_is_multiple_of)
+        batch_beginnings, batch_sizes, batch_seq_lengths = dataset._mark_up_batches(lengths)
+        assert len(batch_beginnings) % number_of_batches_is_multiple_of == 0
+        assert sum(batch_sizes) == len(lengths)
+        assert_array_equal(batch_beginnings, np.cumsum([0] + batch_sizes[:-1]))
+        for beginning, size, seq_length in zip(batch_beginnings, batch_sizes, batch_seq_lengths):
+            assert size > 0
+            assert seq_length % 8 == 0
+            assert seq_length >= lengths[beginning : beginning + size].max()
+
+
+class TestReadDataset:
+    @pytest.mark.unit
+    def test_labels_are_split_into_punctuation_and_capitalization(self, tmp_path):
+        text_file, labels_file = tmp_path / 'text.txt', tmp_path / 'labels.txt'
+        text_file.write_text("hello world\nhow are you\n")
+        labels_file.write_text("OU ,O\nOU OO ?O\n")
+        (
+            text_lines,
+            punct_lines,
+            capit_lines,
+            punct_unique,
+            capit_unique,
+            audio_lines,
+        ) = BertPunctuationCapitalizationDataset._read_dataset(text_file, labels_file, num_samples=-1)
+        assert text_lines == ("hello world\n", "how are you\n")
+        assert punct_lines == ("O,", "OO?")
+        assert capit_lines == ("UO", "UOO")
+        assert punct_unique == {'O', ',', '?'}
+        assert capit_unique == {'O', 'U'}
+        assert audio_lines is None
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("wrong_line", ["O OUU\n", "OUO U\n", "OU O\n"])
+    def test_wrong_label_pair_length_raises(self, tmp_path, wrong_line):
+        text_file, labels_file = tmp_path / 'text.txt', tmp_path / 'labels.txt'
+        text_file.write_text("hello world\nhow are\n")
+        labels_file.write_text("OU ,O\n" + wrong_line)
+        with pytest.raises(ValueError, match="in line 1 in label file"):
+            BertPunctuationCapitalizationDataset._read_dataset(text_file, labels_file, num_samples=-1)
+
+
+class TestLabelFrequencies:
+    def _create_dataset(self, label_info_save_dir):
+        dataset = BertPunctuationCapitalizationDataset.__new__(BertPunctuationCapitalizationDataset)
+        dataset.label_info_save_dir = label_info_save_dir
+        dataset.verbose = False
+        return dataset
+
+    @pytest.mark.unit
+    def test_label_frequencies(self, tmp_path):
+        dataset = self._create_dataset(tmp_path)
+        all_labels = [np.array([0, 1, 1], dtype=np.int8), np.array([], dtype=np.int8), np.array([0, 1], dtype=np.int8)]
+        frequencies = dataset._calculate_and_save_label_frequencies(all_labels, PUNCT_LABEL_IDS, 'punct')
+        assert frequencies == {1: 3, 0: 2}
+        assert (tmp_path / 'label_count_punct.tsv').exists()
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("all_labels", [[], [np.array([], dtype=np.int8)]])
+    def test_no_labels(self, tmp_path, all_labels):
+        dataset = self._create_dataset(tmp_path)
+        assert dataset._calculate_and_save_label_frequencies(all_labels, PUNCT_LABEL_IDS, 'punct') == {}